@@ -0,0 +1,112 @@
+"""
+Загрузка истории отчётов за диапазон дат.
+
+    python -m app.backfill 01-01-2022 31-12-2024 --workers 8
+
+Прогресс хранится в журнале spimex_report_ledger: каждый отчёт фиксируется в БД
+вместе с записью журнала, поэтому после падения повторный запуск с теми же датами
+продолжает с незагруженных дней. Прошедшие дни без отчёта (сервер ответил 404) тоже
+записываются в журнал с row_count=0 и при повторном запуске не запрашиваются.
+"""
+import argparse
+import asyncio
+import time
+from datetime import date, timedelta
+
+from app.cli import parse_date
+from app.config import DOWNLOAD_WORKERS
+from app.database import AsyncSessionLocal
+from app.repositories import get_report_ledger, upsert_report_ledger
+from app.saver import report_date_from_url, spimex_report_url
+from app.services import run_ingest_pipeline
+
+
+def backfill_urls(start_date, end_date, ledger):
+    """ URL отчётов за диапазон дат (от новых к старым) без уже загруженных и проверенных дней без отчёта """
+
+    urls = []
+    day = end_date
+    while day >= start_date:
+        report_url = spimex_report_url(day)
+        if report_url not in ledger:
+            urls.append(report_url)
+        day -= timedelta(days=1)
+    return urls
+
+
+async def record_missing_reports(db, missing_urls):
+    """
+    Записывает в журнал прошедшие дни, отчётов за которые нет на сервере (missing_urls, row_count=0).
+    Отчёт за сегодня может появиться позже, поэтому сегодняшний день не записывается.
+    Возвращает количество записанных дней
+    """
+
+    today = date.today()
+    missing = [url for url in missing_urls if report_date_from_url(url) < today]
+    for report_url in missing:
+        await upsert_report_ledger(db, {
+            "report_date": report_date_from_url(report_url),
+            "url": report_url,
+            "etag": None,
+            "last_modified": None,
+            "content_hash": "",
+            "row_count": 0,
+        })
+    await db.commit()
+    return len(missing)
+
+
+async def backfill(start_date, end_date, workers: int = DOWNLOAD_WORKERS):
+    """ Загружает отчёты за период [start_date, end_date] в workers параллельных скачиваний """
+
+    if start_date > end_date:
+        raise ValueError("Начальная дата больше конечной")
+
+    started = time.perf_counter()
+
+    async with AsyncSessionLocal() as db:
+        ledger = await get_report_ledger(db, since=start_date)
+        report_urls = backfill_urls(start_date, end_date, ledger)
+
+        total_days = (end_date - start_date).days + 1
+        print(f"Загрузка истории {start_date} — {end_date}: дней {total_days}, уже проверено {total_days - len(report_urls)}")
+
+        missing_urls = set()
+        stats = await run_ingest_pipeline(db, report_urls, ledger, download_workers=workers, missing=missing_urls)
+        stats["missing"] = await record_missing_reports(db, missing_urls)
+
+    elapsed = time.perf_counter() - started
+    stats["checked"] = len(report_urls)
+    stats["seconds"] = round(elapsed, 2)
+    stats["files_per_second"] = round(stats["files"] / elapsed, 2) if elapsed else 0.0
+    stats["rows_per_second"] = round(stats["rows"] / elapsed, 2) if elapsed else 0.0
+
+    print(
+        f"Загрузка истории завершена: файлов {stats['files']}, строк {stats['rows']}, дней без отчёта {stats['missing']} "
+        f"за {stats['seconds']} сек. "
+        f"({stats['files_per_second']} файлов/с, {stats['rows_per_second']} строк/с)"
+    )
+    return stats
+
+
+async def main():
+    from app.database import create_db
+    from app.saver import close_http_session
+    from app.services import shutdown_parse_pool
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("start_date", type=parse_date, help="Начальная дата (DD-MM-YYYY)")
+    parser.add_argument("end_date", type=parse_date, help="Конечная дата (DD-MM-YYYY)")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS, help="Параллельных скачиваний")
+    args = parser.parse_args()
+
+    await create_db()
+    try:
+        await backfill(args.start_date, args.end_date, args.workers)
+    finally:
+        await close_http_session()
+        shutdown_parse_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,59 +1,369 @@
-from redis.asyncio import Redis
+import asyncio
 import json
-from datetime import datetime, timedelta, date
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+
+from redis.asyncio import ConnectionPool, Redis
+from typing import Awaitable, Callable, Optional
+
+from app.config import (
+    CACHE_HITS_FLUSH_EVERY,
+    CACHE_HITS_TRACKED,
+    CACHE_LOCK_POLL,
+    CACHE_LOCK_TIMEOUT,
+    CACHE_LOCK_WAIT,
+    CACHE_TTL,
+    CACHE_VERSION_REFRESH,
+    LOCAL_CACHE_MAX_ITEMS,
+    LOCAL_CACHE_TTL,
+    REDIS_CONNECT_TIMEOUT,
+    REDIS_HEALTH_CHECK_INTERVAL,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_SOCKET_TIMEOUT,
+    REDIS_URL,
+)
 
 redis = None
+redis_lock = asyncio.Lock()
 
+# Все торговые дни одним значением: ответ на любой count — его начало
+TRADING_DATES_CACHE_KEY = "last_trading_dates"
 
-async def get_redis():
-    """ Подключение к Redis """
+# Версия данных: увеличивается после каждой загрузки, изменившей БД, и входит в ключи кэша,
+# поэтому ответы по старым данным больше не читаются и сами истекают через CACHE_TTL
+CACHE_VERSION_KEY = "cache_version"
+
+# Версия, которую этот процесс знает, и когда (time.monotonic()) она прочитана из Redis
+cache_version = {"version": None, "checked_at": 0.0}
+
+# Версия, при которой запрос не нашёл ключ в кэше: значение, посчитанное по БД после этого,
+# сохраняется под ней, даже если загрузка успела сменить версию (тогда его никто не прочитает)
+miss_version = ContextVar("miss_version", default=None)
+
+# Частота запросов для прогрева: отсортированное множество запросов (JSON) по числу обращений
+CACHE_HITS_KEY = "cache_hits"
+
+# Обращения, ещё не отправленные в Redis, и их общее число
+hit_counts = Counter()
+pending_hits = 0
+
+# Запущенные отправки счётчиков: цикл событий держит на задачи только слабые ссылки
+flush_tasks = set()
+
+# Значения, которые этот процесс сейчас считает после промаха: ключ с версией -> задача
+in_flight = {}
+
+# Снятие блокировки, только если она всё ещё своя (могла истечь и достаться другому воркеру)
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class LocalCache:
+    """
+    Кэш в памяти процесса перед Redis: не больше max_items значений,
+    при переполнении вытесняется давно не использованное, у каждого значения свой срок жизни
+    """
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self.items = OrderedDict()  # ключ -> (значение, time.monotonic() истечения)
+
+    def get(self, key: str) -> Optional[bytes]:
+        item = self.items.get(key)
+        if item is None:
+            return None
+
+        value, expires_at = item
+        if time.monotonic() >= expires_at:
+            del self.items[key]
+            return None
+
+        self.items.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        if self.max_items <= 0 or ttl <= 0:
+            return
+
+        self.items[key] = (value, time.monotonic() + ttl)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def delete(self, key: str):
+        self.items.pop(key, None)
+
+    def clear(self):
+        self.items.clear()
+
+
+local_cache = LocalCache(LOCAL_CACHE_MAX_ITEMS)
+
+
+async def init_redis():
+    """ Клиент Redis с общим пулом соединений (создаётся при старте приложения) """
 
     global redis
-    if not redis:
-        redis = await Redis.from_url("redis://localhost:6379")
+    async with redis_lock:
+        if redis is None:
+            pool = ConnectionPool.from_url(
+                REDIS_URL,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+            )
+            redis = Redis(connection_pool=pool)
     return redis
 
 
-async def get_cached_data(key: str):
-    """ Получение данных из кэша """
+async def close_redis():
+    """ Закрытие клиента Redis и его пула соединений (при остановке приложения) """
+
+    global redis
+    async with redis_lock:
+        if redis is not None:
+            await redis.aclose(close_connection_pool=True)
+            redis = None
+
+
+async def get_redis():
+    """ Подключение к Redis (вне приложения, например в CLI, клиент создаётся при первом обращении) """
+
+    if redis is None:
+        return await init_redis()
+    return redis
+
+
+async def get_cache_version() -> int:
+    """ Текущая версия данных (из памяти процесса, если она прочитана из Redis недавно) """
+
+    if cache_version["version"] is not None and time.monotonic() - cache_version["checked_at"] < CACHE_VERSION_REFRESH:
+        return cache_version["version"]
 
-    print(f"Попытка получить данные из кэша для получения ключа: {key}")
     r = await get_redis()
-    data = await r.get(key)
+    version = int(await r.get(CACHE_VERSION_KEY) or 0)
+    cache_version.update(version=version, checked_at=time.monotonic())
+    return version
+
+
+async def bump_cache_version() -> int:
+    """ Смена версии данных после загрузки: все прежние ответы в кэше перестают читаться """
+
+    r = await get_redis()
+    version = await r.incr(CACHE_VERSION_KEY)
+    cache_version.update(version=version, checked_at=time.monotonic())
+    print(f"Версия данных кэша: {version}")
+    return version
+
+
+def versioned_key(key: str, version: int) -> str:
+    """ Ключ кэша с версией данных """
+
+    return f"v{version}:{key}"
+
+
+async def get_cached_data(key: str) -> Optional[bytes]:
+    """
+    Получение готового тела ответа из кэша (байты как есть, без десериализации) для текущей версии данных:
+    сначала из памяти процесса, затем из Redis
+    """
+
+    version = await get_cache_version()
+    full_key = versioned_key(key, version)
+
+    data = local_cache.get(full_key)
+    if data is not None:
+        print(f"Данные из локального кэша для ключа: {full_key}")
+        return data
+
+    print(f"Попытка получить данные из кэша для получения ключа: {full_key}")
+    r = await get_redis()
+    data = await r.get(full_key)
 
     if data:
-        print(f"Данные из кэша для ключа: {key}")
+        print(f"Данные из кэша для ключа: {full_key}")
+        local_cache.set(full_key, data, min(CACHE_TTL, LOCAL_CACHE_TTL))
     else:
-        print(f"Нет данных в кэше для ключа: {key}")
+        print(f"Нет данных в кэше для ключа: {full_key}")
+        miss_version.set(version)
+
+    return data
+
 
-    return json.loads(data) if data else None
+async def get_many_cached_data(keys: list[str]) -> list[Optional[bytes]]:
+    """
+    Несколько тел ответов из кэша: что есть в памяти процесса — оттуда,
+    остальное одним MGET из Redis. Порядок значений — как у ключей, None — нет в кэше
+    """
 
+    version = await get_cache_version()
+    full_keys = [versioned_key(key, version) for key in keys]
+    values = [local_cache.get(full_key) for full_key in full_keys]
 
-async def set_cached_data(key: str, value):
-    """ Сохранение данных в кэш до 14:11 """
+    missing = [i for i, value in enumerate(values) if value is None]
+    if missing:
+        r = await get_redis()
+        for i, data in zip(missing, await r.mget([full_keys[i] for i in missing])):
+            if data is not None:
+                values[i] = data
+                local_cache.set(full_keys[i], data, min(CACHE_TTL, LOCAL_CACHE_TTL))
+        miss_version.set(version)
 
-    def date_converter(obj):
-        """ Функция для сериализации объектов типа "date" """
+    print(f"Данные из кэша для {len(keys) - values.count(None)} из {len(keys)} ключей")
+    return values
 
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()  # Преобразует в строку ISO 8601
-        raise TypeError(f"Тип {obj.__class__.__name__} не сериализуется")
 
+async def set_many_cached_data(items: dict[str, bytes]):
+    """ Сохранение нескольких тел ответов в кэш одним конвейером SET с TTL """
+
+    if not items:
+        return
+
+    version = miss_version.get()
+    if version is None:
+        version = await get_cache_version()
+
+    full_items = {versioned_key(key, version): value for key, value in items.items()}
     r = await get_redis()
-    now = datetime.now()
-    reset_time = now.replace(hour=14, minute=11, second=0, microsecond=0)
+    async with r.pipeline(transaction=False) as pipe:
+        for full_key, value in full_items.items():
+            pipe.set(full_key, value, ex=CACHE_TTL)
+        await pipe.execute()
 
-    # Если текущее время больше или равно 14:11, устанавливается сброс на следующий день
-    if now >= reset_time:
-        reset_time += timedelta(days=1)
+    for full_key, value in full_items.items():
+        local_cache.set(full_key, value, min(CACHE_TTL, LOCAL_CACHE_TTL))
+    print(f"Данные для {len(items)} ключей, истекают через: {CACHE_TTL} сек.")
 
-    expire_seconds = (reset_time - now).total_seconds()
-    await r.set(key, json.dumps(value, default=date_converter), ex=int(expire_seconds))
-    print(f"Данные для ключа: {key}, истекает в: {reset_time}")
+
+async def set_cached_data(key: str, value: bytes):
+    """ Сохранение готового тела ответа в кэш под версией данных, при которой его не нашли в кэше """
+
+    version = miss_version.get()
+    if version is None:
+        version = await get_cache_version()
+    full_key = versioned_key(key, version)
+
+    r = await get_redis()
+    await r.set(full_key, value, ex=CACHE_TTL)
+    local_cache.set(full_key, value, min(CACHE_TTL, LOCAL_CACHE_TTL))
+    print(f"Данные для ключа: {full_key}, истекает через: {CACHE_TTL} сек.")
 
 
 async def clear_cache():
-    """ Очистка всего кэша в 14:11 """
+    """ Сброс всего кэша сменой версии данных, без очистки Redis целиком """
+
+    local_cache.clear()
+    await bump_cache_version()
+
+
+async def compute_with_lock(full_key: str, compute: Callable[[], Awaitable[bytes]]) -> bytes:
+    """
+    Считает значение, если блокировку ключа в Redis не держит другой воркер,
+    иначе ждёт его значение в Redis (не дольше CACHE_LOCK_WAIT) и только потом считает сам
+    """
+
+    lock_key = f"lock:{full_key}"
+    token = uuid.uuid4().hex
+    try:
+        r = await get_redis()
+        locked = await r.set(lock_key, token, nx=True, px=int(CACHE_LOCK_TIMEOUT * 1000))
+    except Exception as e:
+        print(f"Не удалось взять блокировку кэша {lock_key}: {e}")
+        return await compute()
+
+    if not locked:
+        print(f"Значение для ключа {full_key} считает другой воркер, ожидание")
+        deadline = time.monotonic() + CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(CACHE_LOCK_POLL)
+            data, lock = await r.mget(full_key, lock_key)
+            if data is not None:
+                local_cache.set(full_key, data, min(CACHE_TTL, LOCAL_CACHE_TTL))
+                return data
+            if lock is None:  # другой воркер не смог посчитать значение
+                break
+        return await compute()
+
+    try:
+        return await compute()
+    finally:
+        try:
+            await r.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+        except Exception as e:
+            print(f"Не удалось снять блокировку кэша {lock_key}: {e}")
+
+
+async def single_flight(key: str, compute: Callable[[], Awaitable[bytes]]) -> bytes:
+    """
+    Значение для ключа, которого не оказалось в кэше: compute считает его (и сохраняет в кэш) один раз
+    на все одновременные запросы процесса, а между воркерами — один раз благодаря блокировке в Redis.
+    Вызывается после промаха get_cached_data с тем же ключом
+    """
+
+    version = miss_version.get()
+    if version is None:
+        version = await get_cache_version()
+    full_key = versioned_key(key, version)
+
+    task = in_flight.get(full_key)
+    if task is None:
+        # Отдельная задача: если первый запрос отменят, остальные всё равно дождутся значения
+        task = asyncio.ensure_future(compute_with_lock(full_key, compute))
+        in_flight[full_key] = task
+        task.add_done_callback(lambda _: in_flight.pop(full_key, None))
+    else:
+        print(f"Значение для ключа {full_key} уже считается, ожидание")
+
+    return await asyncio.shield(task)
+
+
+def record_hit(endpoint: str, params: dict):
+    """
+    Учёт запроса к эндпоинту для прогрева кэша. Счётчики копятся в памяти процесса
+    и отправляются в Redis одной пачкой каждые CACHE_HITS_FLUSH_EVERY запросов
+    """
+
+    global pending_hits
+    hit_counts[json.dumps({"endpoint": endpoint, "params": params}, sort_keys=True)] += 1
+    pending_hits += 1
+    if pending_hits >= CACHE_HITS_FLUSH_EVERY:
+        pending_hits = 0
+        task = asyncio.ensure_future(flush_hits())
+        flush_tasks.add(task)
+        task.add_done_callback(flush_tasks.discard)
+
+
+async def flush_hits():
+    """ Отправка накопленных счётчиков запросов в Redis, хранятся только CACHE_HITS_TRACKED самых частых """
+
+    global pending_hits
+    if not hit_counts:
+        return
+
+    counts = dict(hit_counts)
+    hit_counts.clear()
+    pending_hits = 0
+    try:
+        r = await get_redis()
+        async with r.pipeline(transaction=False) as pipe:
+            for member, count in counts.items():
+                pipe.zincrby(CACHE_HITS_KEY, count, member)
+            pipe.zremrangebyrank(CACHE_HITS_KEY, 0, -CACHE_HITS_TRACKED - 1)
+            await pipe.execute()
+    except Exception as e:
+        print(f"Не удалось сохранить счётчики запросов: {e}")
+
+
+async def get_top_hits(count: int) -> list[tuple[str, dict]]:
+    """ Самые частые запросы: (эндпоинт, параметры) по убыванию числа обращений """
 
     r = await get_redis()
-    await r.flushdb()
+    members = await r.zrevrange(CACHE_HITS_KEY, 0, count - 1)
+    return [(hit["endpoint"], hit["params"]) for hit in map(json.loads, members)]
@@ -0,0 +1,11 @@
+import argparse
+from datetime import datetime
+
+
+def parse_date(value):
+    """ Дата в формате DD-MM-YYYY, как в API """
+
+    try:
+        return datetime.strptime(value, "%d-%m-%Y").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("Дата должна быть в формате DD-MM-YYYY")
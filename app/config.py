@@ -0,0 +1,181 @@
+import os
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def env_flag(name: str, default: bool) -> bool:
+    """ Логическая настройка из окружения: 1/true/yes — включено, пустое значение — default """
+
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+def env_ints(name: str, default: str) -> list[int]:
+    """ Список чисел из окружения через запятую """
+
+    return [int(value) for value in (os.getenv(name) or default).split(",") if value.strip()]
+
+
+CONFLICT_POLICIES = ("skip", "update")
+
+
+def conflict_policy(value: str) -> str:
+    """ Политика конфликтов при загрузке; опечатка в окружении останавливает запуск, а не каждую загрузку """
+
+    if value not in CONFLICT_POLICIES:
+        raise ValueError(f"Неизвестная политика конфликтов '{value}', допустимые: {CONFLICT_POLICIES}")
+    return value
+
+
+# Что делать со строками отчёта, которые уже есть в БД по (date, exchange_product_id): "skip" или "update"
+INGEST_CONFLICT_POLICY = conflict_policy(os.getenv("INGEST_CONFLICT_POLICY") or "skip")
+
+# Пул процессов для парсинга Excel: количество процессов и сколько файлов одновременно в работе
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+PARSE_MAX_IN_FLIGHT = int(os.getenv("PARSE_MAX_IN_FLIGHT", PARSE_WORKERS * 2))
+
+# Адрес отчётов SPIMEX (к нему добавляется YYYYMMDD162000.xls)
+SPIMEX_BASE_URL = os.getenv("SPIMEX_BASE_URL", "https://spimex.com/upload/reports/oil_xls/oil_xls_")
+
+# Поиск отчётов: глубина в днях, количество одновременных проверок и таймаут одной проверки (сек)
+DISCOVERY_DAYS = int(os.getenv("DISCOVERY_DAYS", 30))
+DISCOVERY_CONCURRENCY = int(os.getenv("DISCOVERY_CONCURRENCY", 30))
+DISCOVERY_TIMEOUT = float(os.getenv("DISCOVERY_TIMEOUT", 3))
+
+# Общий HTTP-клиент: лимиты соединений, keep-alive (сек), повторы с экспоненциальной задержкой (сек)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", 30))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.5))
+
+# Скачивание отчётов: таймаут на файл (сек) и размер читаемого блока (байт)
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 30))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 64 * 1024))
+
+# Конвейер загрузки: одновременные скачивания, размер очередей между стадиями и сохранение файлов на диск
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", 4))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 4))
+SAVE_REPORTS_TO_DISK = env_flag("SAVE_REPORTS_TO_DISK", False)
+
+# Кэш и чтение с реплик узнают о записанных отчётах сразу после первого из них, а дальше — не чаще раза
+# в INGEST_PUBLISH_INTERVAL секунд (0 — после каждого отчёта)
+INGEST_PUBLISH_INTERVAL = float(os.getenv("INGEST_PUBLISH_INTERVAL", 5))
+
+# Выгрузка /export/: строк в одном блоке, который читается из курсора БД и отправляется клиенту
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+
+
+@dataclass(frozen=True)
+class DatabaseSettings:
+    """ Настройки движка и пула соединений БД """
+
+    pool_size: int
+    max_overflow: int
+    pool_timeout: float
+    pool_recycle: int
+    pool_pre_ping: bool
+    statement_cache_size: int
+    statement_timeout_ms: int
+    echo: bool
+
+    def engine_kwargs(self) -> dict:
+        """ Аргументы create_async_engine """
+
+        return {
+            "echo": self.echo,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_recycle": self.pool_recycle,
+            "pool_pre_ping": self.pool_pre_ping,
+            "connect_args": {
+                # Кэш подготовленных запросов: SQLAlchemy (prepared_statement_cache_size) и самого asyncpg.
+                # За pgbouncer в режиме transaction оба нужно выключить (0)
+                "prepared_statement_cache_size": self.statement_cache_size,
+                "statement_cache_size": self.statement_cache_size,
+                "server_settings": {"statement_timeout": str(self.statement_timeout_ms)},
+            },
+        }
+
+
+# Значения по умолчанию для режима запуска MODE, каждое переопределяется непустой переменной DB_*.
+# PROD рассчитан на много одновременных запросов: большой пул, короткое ожидание соединения
+# (запрос быстрее получит ошибку, чем повиснет), ограничение времени запроса, без эха SQL
+DATABASE_MODE_DEFAULTS = {
+    "DEV": {
+        "pool_size": 5, "max_overflow": 10, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": True,
+        "statement_cache_size": 100, "statement_timeout_ms": 60_000, "echo": True,
+    },
+    "TEST": {
+        "pool_size": 5, "max_overflow": 5, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": False,
+        "statement_cache_size": 100, "statement_timeout_ms": 60_000, "echo": False,
+    },
+    "PROD": {
+        "pool_size": 20, "max_overflow": 30, "pool_timeout": 5, "pool_recycle": 1800, "pool_pre_ping": True,
+        "statement_cache_size": 500, "statement_timeout_ms": 15_000, "echo": False,
+    },
+}
+
+
+def load_database_settings(mode) -> DatabaseSettings:
+    """ Настройки БД для режима mode (неизвестный режим считается PROD) с учётом переменных DB_* """
+
+    defaults = DATABASE_MODE_DEFAULTS.get(mode, DATABASE_MODE_DEFAULTS["PROD"])
+    return DatabaseSettings(
+        pool_size=int(os.getenv("DB_POOL_SIZE") or defaults["pool_size"]),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW") or defaults["max_overflow"]),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT") or defaults["pool_timeout"]),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE") or defaults["pool_recycle"]),
+        pool_pre_ping=env_flag("DB_POOL_PRE_PING", defaults["pool_pre_ping"]),
+        statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE") or defaults["statement_cache_size"]),
+        statement_timeout_ms=int(os.getenv("DB_STATEMENT_TIMEOUT_MS") or defaults["statement_timeout_ms"]),
+        echo=env_flag("DB_ECHO", defaults["echo"]),
+    )
+
+
+MODE = os.getenv("MODE")
+DATABASE_SETTINGS = load_database_settings(MODE)
+
+# Чтение с реплик: сколько секунд после загрузки читать с основной БД, пока реплики догоняют её,
+# и как часто (сек) проверять в Redis такую отметку других воркеров
+REPLICA_LAG_SECONDS = float(os.getenv("REPLICA_LAG_SECONDS", 5))
+REPLICA_LAG_REFRESH = float(os.getenv("REPLICA_LAG_REFRESH", 1))
+
+# Кэш ответов: срок жизни в Redis (сек). Устаревают ответы не по времени, а со сменой версии данных при загрузке,
+# версия перечитывается из Redis не чаще раза в CACHE_VERSION_REFRESH секунд
+CACHE_TTL = int(os.getenv("CACHE_TTL", 24 * 60 * 60))
+CACHE_VERSION_REFRESH = float(os.getenv("CACHE_VERSION_REFRESH", 1))
+
+# Локальный кэш процесса перед Redis: сколько ответов хранить и сколько секунд максимум
+LOCAL_CACHE_MAX_ITEMS = int(os.getenv("LOCAL_CACHE_MAX_ITEMS", 1000))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", 30))
+
+# Промах кэша считает один запрос: остальные ждут его значение. Блокировка в Redis для других воркеров
+# живёт CACHE_LOCK_TIMEOUT секунд, ожидание чужого значения — не дольше CACHE_LOCK_WAIT, затем считают сами
+CACHE_LOCK_TIMEOUT = float(os.getenv("CACHE_LOCK_TIMEOUT", 10))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", 5))
+CACHE_LOCK_POLL = float(os.getenv("CACHE_LOCK_POLL", 0.05))
+
+# Прогрев кэша после загрузки: размеры первых страниц get_trading_results, окна get_dynamics (дней до сегодня)
+# и сколько самых частых запросов из счётчика взять дополнительно (0 — только заданные ключи)
+CACHE_WARMUP = env_flag("CACHE_WARMUP", True)
+CACHE_WARMUP_LIMITS = env_ints("CACHE_WARMUP_LIMITS", "10,100")
+CACHE_WARMUP_DYNAMICS_DAYS = env_ints("CACHE_WARMUP_DYNAMICS_DAYS", "7,30")
+CACHE_WARMUP_TOP_HITS = int(os.getenv("CACHE_WARMUP_TOP_HITS", 20))
+
+# Счётчик запросов: отправляется в Redis каждые CACHE_HITS_FLUSH_EVERY запросов, хранятся CACHE_HITS_TRACKED самых частых
+CACHE_HITS_FLUSH_EVERY = int(os.getenv("CACHE_HITS_FLUSH_EVERY", 100))
+CACHE_HITS_TRACKED = int(os.getenv("CACHE_HITS_TRACKED", 1000))
+
+# Redis: адрес, размер пула соединений и таймауты (сек) подключения и операций
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 2))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 2))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
@@ -1,10 +1,18 @@
+import itertools
 import os
+import time
+from contextlib import asynccontextmanager
 
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy import event, text
 from dotenv import load_dotenv
 from app.base import Base
+from app.cache import get_redis
+from app.config import DATABASE_SETTINGS, MODE, REPLICA_LAG_REFRESH, REPLICA_LAG_SECONDS
+from app.migrations import MIGRATIONS_LOCK_KEY, apply_migrations
 
 load_dotenv()
 
@@ -14,20 +22,95 @@ POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT")
 
-MODE = os.getenv("MODE")
-
 DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_NAME}"
 
-print(f"Final DATABASE_URL in app.database: {DATABASE_URL}")
 print(f"MODE in app.database: {MODE}")
 
 ADMIN_DATABASE_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/postgres"
 
-engine = create_async_engine(DATABASE_URL, echo=True)
-admin_engine = create_async_engine(ADMIN_DATABASE_URL, echo=True)
+# Реплики для чтения: "host" или "host:port" через запятую, пользователь, пароль и БД — как у основной
+POSTGRES_REPLICA_HOSTS = [host.strip() for host in os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",") if host.strip()]
+REPLICA_DATABASE_URLS = [
+    f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{host}/{POSTGRES_NAME}"
+    for host in (host if ":" in host else f"{host}:{POSTGRES_PORT}" for host in POSTGRES_REPLICA_HOSTS)
+]
+
+# Ключ Redis, пока он жив, все воркеры читают с основной БД
+PRIMARY_READS_KEY = "primary_reads"
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений со статистикой выдачи соединений (публичный Pool.connect()). Время выдачи делится
+    на создание нового соединения с БД (между событиями do_connect и connect) и ожидание свободного
+    соединения — остальное. С pool_pre_ping в ожидание входит и проверочный запрос
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = {
+            "checkouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0, "timeouts": 0,
+            "connects": 0, "connect_seconds": 0.0,
+        }
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.wait_stats["timeouts"] += 1
+            raise
+
+        # Соединение, созданное при этой выдаче, несёт время своего создания в info
+        connect_seconds = connection.info.pop("connect_seconds", None)
+        if connect_seconds is not None:
+            self.wait_stats["connects"] += 1
+            self.wait_stats["connect_seconds"] += connect_seconds
+
+        waited = max(0.0, time.perf_counter() - started - (connect_seconds or 0.0))
+        self.wait_stats["checkouts"] += 1
+        self.wait_stats["wait_seconds"] += waited
+        self.wait_stats["max_wait_seconds"] = max(self.wait_stats["max_wait_seconds"], waited)
+        return connection
+
+
+def mark_connect_started(dialect, connection_record, cargs, cparams):
+    """ Событие do_connect: начало создания соединения с БД """
+
+    connection_record.info["connect_started"] = time.perf_counter()
+
+
+def mark_connected(dbapi_connection, connection_record):
+    """ Событие пула connect: соединение создано, его время забирает TimedAsyncAdaptedQueuePool.connect() """
+
+    started = connection_record.info.pop("connect_started", None)
+    connection_record.info["connect_seconds"] = time.perf_counter() - started if started is not None else 0.0
+
+
+def create_pooled_engine(url):
+    """ Движок с пулом TimedAsyncAdaptedQueuePool по настройкам DATABASE_SETTINGS """
+
+    pooled_engine = create_async_engine(url, poolclass=TimedAsyncAdaptedQueuePool, **DATABASE_SETTINGS.engine_kwargs())
+    event.listen(pooled_engine.sync_engine, "do_connect", mark_connect_started)
+    event.listen(pooled_engine.sync_engine, "connect", mark_connected)
+    return pooled_engine
+
+
+engine = create_pooled_engine(DATABASE_URL)
+# Служебное соединение для CREATE DATABASE нужно один раз при старте, пул ему не нужен
+admin_engine = create_async_engine(ADMIN_DATABASE_URL, poolclass=NullPool, echo=DATABASE_SETTINGS.echo)
+
+replica_engines = [create_pooled_engine(url) for url in REPLICA_DATABASE_URLS]
+# Чтение API идёт в транзакциях только на чтение (BEGIN READ ONLY): случайная запись из GET-запроса падает с ошибкой
+primary_read_engine = engine.execution_options(postgresql_readonly=True)
+replica_cycle = itertools.cycle([replica.execution_options(postgresql_readonly=True) for replica in replica_engines])
 
 AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
+# До момента until (time.time()) процесс читает с основной БД. Отметку других воркеров
+# процесс перечитывает из Redis не чаще раза в REPLICA_LAG_REFRESH секунд (checked_at — time.monotonic())
+primary_reads = {"until": 0.0, "checked_at": None}
+
 
 async def create_db():
     """ Создание БД """
@@ -39,7 +122,12 @@ async def create_db():
             await conn.execute(text(f"CREATE DATABASE {POSTGRES_NAME}"))
 
     async with engine.begin() as conn:
+        # Миграции на большой таблице (перенос строк, индексы) идут дольше statement_timeout запросов API
+        await conn.execute(text("SET LOCAL statement_timeout = 0"))
+        # Несколько воркеров стартуют одновременно: схему создаёт и мигрирует только один из них
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(apply_migrations)
 
 
 async def get_db():
@@ -47,3 +135,80 @@ async def get_db():
 
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def mark_primary_write():
+    """
+    Запись в основную БД: следующие REPLICA_LAG_SECONDS чтение идёт с неё, а не с реплик,
+    которые могут ещё не получить новые строки. Остальные воркеры узнают об этом через Redis
+    """
+
+    if not replica_engines:
+        return
+
+    primary_reads["until"] = time.time() + REPLICA_LAG_SECONDS
+    try:
+        r = await get_redis()
+        await r.set(PRIMARY_READS_KEY, primary_reads["until"], px=int(REPLICA_LAG_SECONDS * 1000))
+    except Exception as e:
+        print(f"Не удалось отметить чтение с основной БД в Redis: {e}")
+
+
+async def reads_from_primary() -> bool:
+    """ Идёт ли сейчас чтение с основной БД после недавней загрузки (в этом или другом воркере) """
+
+    if time.time() < primary_reads["until"]:
+        return True
+    checked_at = primary_reads["checked_at"]
+    if checked_at is not None and time.monotonic() - checked_at < REPLICA_LAG_REFRESH:
+        return False
+
+    try:
+        r = await get_redis()
+        until = await r.get(PRIMARY_READS_KEY)
+    except Exception as e:
+        print(f"Не удалось проверить чтение с основной БД в Redis: {e}")
+        until = None
+    if until is not None:
+        primary_reads["until"] = max(primary_reads["until"], float(until))
+    primary_reads["checked_at"] = time.monotonic()
+    return time.time() < primary_reads["until"]
+
+
+async def read_engine():
+    """ Движок для чтения: реплики по кругу, без реплик или сразу после загрузки — основная БД """
+
+    if not replica_engines or await reads_from_primary():
+        return primary_read_engine
+    return next(replica_cycle)
+
+
+@asynccontextmanager
+async def read_session():
+    """
+    Сессия для чтения API: только чтение, с реплики, если она есть. Открывается там, где идёт запрос к БД
+    (внутри общей задачи single_flight), а не зависимостью эндпоинта: сессия первого запроса закрывается
+    вместе с ним, а задача продолжает работать для ждущих запросов
+    """
+
+    async with AsyncSessionLocal(bind=await read_engine()) as session:
+        yield session
+
+
+def get_pool_stats(pool=None) -> dict:
+    """ Состояние пула соединений (по умолчанию основной БД), время ожидания и создания соединений (мс) """
+
+    pool = pool or engine.sync_engine.pool
+    wait = pool.wait_stats
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "checkouts": wait["checkouts"],
+        "avg_wait_ms": round(wait["wait_seconds"] / wait["checkouts"] * 1000, 3) if wait["checkouts"] else 0.0,
+        "max_wait_ms": round(wait["max_wait_seconds"] * 1000, 3),
+        "timeouts": wait["timeouts"],
+        "connects": wait["connects"],
+        "avg_connect_ms": round(wait["connect_seconds"] / wait["connects"] * 1000, 3) if wait["connects"] else 0.0,
+    }
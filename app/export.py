@@ -0,0 +1,158 @@
+"""
+Потоковая выгрузка торгов в CSV, NDJSON и Parquet.
+
+Строки читаются серверным курсором БД блоками по EXPORT_CHUNK_SIZE, каждый блок сразу
+кодируется и отправляется клиенту, поэтому память не зависит от длины периода.
+Для Parquet нужен pyarrow (pip install pyarrow): каждый блок пишется отдельной группой строк.
+"""
+import csv
+import io
+
+from pydantic import TypeAdapter
+
+from app.config import EXPORT_CHUNK_SIZE
+from app.database import read_session
+from app.repositories import RESPONSE_COLUMNS
+from app.schemas import SpimexTradingResultResponse
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow — необязательная зависимость, без неё недоступен только Parquet
+    pa = pq = None
+
+# Формат -> (тип содержимого, расширение файла)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+EXPORT_COLUMNS = [column.key for column in RESPONSE_COLUMNS]
+
+row_adapter = TypeAdapter(SpimexTradingResultResponse)
+
+
+def parquet_available() -> bool:
+    """ Установлен ли pyarrow """
+
+    return pq is not None
+
+
+async def stream_rows(query):
+    """ Блоки строк запроса из серверного курсора (своя сессия: ответ отдаётся после выхода из эндпоинта) """
+
+    async with read_session() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        async for rows in result.partitions():
+            yield rows
+
+
+async def encode_csv(chunks):
+    """ CSV с заголовком из названий столбцов """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    async for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():  # пустая выгрузка — только заголовок
+        yield buffer.getvalue().encode()
+
+
+async def encode_ndjson(chunks):
+    """ Одна JSON-строка на запись, поля как в ответах API """
+
+    async for rows in chunks:
+        yield b"".join(
+            row_adapter.dump_json(row_adapter.validate_python(row, from_attributes=True)) + b"\n" for row in rows
+        )
+
+
+class ParquetStreamSink:
+    """
+    Файл для ParquetWriter, который не хранит уже отданные байты.
+    tell() возвращает полную длину записанного: по ней Parquet считает смещения в футере
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        """ Байты, записанные с прошлого вызова """
+
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def parquet_schema():
+    """ Схема Parquet по столбцам ответа API """
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("exchange_product_id", pa.string()),
+        ("exchange_product_name", pa.string()),
+        ("oil_id", pa.string()),
+        ("delivery_basis_id", pa.string()),
+        ("delivery_basis_name", pa.string()),
+        ("delivery_type_id", pa.string()),
+        ("volume", pa.float64()),
+        ("total", pa.float64()),
+        ("count", pa.int64()),
+        ("date", pa.date32()),
+    ])
+
+
+async def encode_parquet(chunks):
+    """ Parquet: блок строк — группа строк файла, футер отправляется в конце """
+
+    schema = parquet_schema()
+    sink = ParquetStreamSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    try:
+        async for rows in chunks:
+            columns = zip(*rows)
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+
+    yield sink.drain()
+
+
+ENCODERS = {
+    "csv": encode_csv,
+    "ndjson": encode_ndjson,
+    "parquet": encode_parquet,
+}
+
+
+def stream_export(query, export_format: str):
+    """ Поток байтов выгрузки результатов запроса в формате export_format """
+
+    return ENCODERS[export_format](stream_rows(query))
@@ -5,12 +5,21 @@ from app.routes import router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    from app.cache import close_redis, flush_hits, init_redis
     from app.database import create_db
+    from app.saver import close_http_session, init_http_session
+    from app.services import shutdown_parse_pool
     import asyncio
 
     await asyncio.sleep(1)
     await create_db()
+    await init_redis()
+    await init_http_session()
     yield
+    await flush_hits()
+    await close_redis()
+    await close_http_session()
+    shutdown_parse_pool()
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(router)
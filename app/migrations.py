@@ -0,0 +1,150 @@
+"""
+Миграции схемы БД.
+
+create_all создаёт только отсутствующие таблицы и не меняет существующие, поэтому
+изменения уже развёрнутых таблиц (ограничения, индексы) описываются здесь списком
+версий. Применённые версии хранятся в таблице schema_migrations. Каждая миграция
+идемпотентна: на свежей БД, которую только что построил create_all, она ничего не меняет.
+"""
+from sqlalchemy import text
+
+from app.models import SpimexTradingResult
+from app.partitions import TABLE, create_partition_statements
+from app.repositories import build_rollup_refresh_statements
+
+# Ключ pg_advisory_xact_lock: схему одновременно меняет только один процесс
+MIGRATIONS_LOCK_KEY = 7_320_001
+
+
+def add_trading_results_unique_key(conn):
+    """ Уникальный ключ (date, exchange_product_id) с удалением накопившихся дублей """
+
+    conn.execute(text("""
+        DELETE FROM spimex_trading_results a
+        USING spimex_trading_results b
+        WHERE a.date = b.date
+          AND a.exchange_product_id = b.exchange_product_id
+          AND a.id > b.id
+    """))
+    conn.execute(text("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'uq_spimex_trading_results_date_product'
+            ) THEN
+                ALTER TABLE spimex_trading_results
+                    ADD CONSTRAINT uq_spimex_trading_results_date_product UNIQUE (date, exchange_product_id);
+            END IF;
+        END $$
+    """))
+
+
+def add_trading_results_query_indexes(conn):
+    """
+    Составные индексы под фильтры API и keyset-пагинацию (id в конце). Индексы записаны явно,
+    а не берутся из модели: миграция не должна меняться вместе с моделью. Удаляются индекс
+    по первичному ключу и прежние индексы по (..., date) без id
+    """
+
+    for name in (
+        "ix_spimex_trading_results_id",
+        "ix_spimex_trading_results_oil_date",
+        "ix_spimex_trading_results_basis_date",
+        "ix_spimex_trading_results_oil_basis_type_date",
+    ):
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    for name, columns in (
+        ("ix_spimex_trading_results_date_id", "date, id"),
+        ("ix_spimex_trading_results_oil_date_id", "oil_id, date, id"),
+        ("ix_spimex_trading_results_basis_date_id", "delivery_basis_id, date, id"),
+        ("ix_spimex_trading_results_oil_basis_type_date_id", "oil_id, delivery_basis_id, delivery_type_id, date, id"),
+    ):
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON spimex_trading_results ({columns})"))
+
+
+def fill_trading_dates(conn):
+    """ Заполняет справочник торговых дней по уже загруженным данным """
+
+    conn.execute(text("""
+        INSERT INTO spimex_trading_dates (date)
+        SELECT DISTINCT date FROM spimex_trading_results
+        ON CONFLICT (date) DO NOTHING
+    """))
+
+
+def fill_daily_rollups(conn):
+    """ Считает дневные суммы по уже загруженным данным """
+
+    for stmt in build_rollup_refresh_statements():
+        conn.execute(stmt)
+
+
+def partition_trading_results(conn):
+    """
+    Перевод spimex_trading_results в секционированную по месяцам таблицу.
+    Старая таблица переименовывается, создаётся новая с партициями всех месяцев данных,
+    строки переносятся одним INSERT ... SELECT, счётчик id продолжается с максимального
+    """
+
+    kind = conn.execute(text(f"SELECT relkind FROM pg_class WHERE oid = CAST('{TABLE}' AS regclass)")).scalar()
+    if kind == "p":  # таблица уже создана секционированной
+        return
+
+    legacy = f"{TABLE}_legacy"
+    conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {legacy}"))
+
+    # Имена индексов (вместе с ограничениями) и последовательности уникальны в схеме — старые переименовываются
+    indexes = conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": legacy})
+    for index_name in indexes.scalars().all():
+        conn.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_legacy"'))
+    conn.execute(text(f"ALTER SEQUENCE IF EXISTS {TABLE}_id_seq RENAME TO {legacy}_id_seq"))
+
+    SpimexTradingResult.__table__.create(conn)
+
+    months = conn.execute(text(f"SELECT DISTINCT CAST(date_trunc('month', date) AS date) FROM {legacy}"))
+    for month in months.scalars().all():
+        for stmt in create_partition_statements(month):
+            conn.execute(stmt)
+
+    columns = ", ".join(column.name for column in SpimexTradingResult.__table__.columns)
+    conn.execute(text(f"INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {legacy}"))
+    conn.execute(text(f"""
+        SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE((SELECT max(id) FROM {TABLE}), 0) + 1, false)
+    """))
+    conn.execute(text(f"DROP TABLE {legacy}"))
+
+
+# (версия, описание, функция от синхронного соединения) — только добавлять в конец
+MIGRATIONS = [
+    (1, "unique key on spimex_trading_results (date, exchange_product_id)", add_trading_results_unique_key),
+    (2, "query and keyset pagination indexes on spimex_trading_results", add_trading_results_query_indexes),
+    (3, "fill spimex_trading_dates from spimex_trading_results", fill_trading_dates),
+    (4, "fill spimex_daily_rollups from spimex_trading_results", fill_daily_rollups),
+    (5, "monthly range partitions for spimex_trading_results", partition_trading_results),
+]
+
+
+def apply_migrations(conn):
+    """ Применяет недостающие миграции (вызывается через AsyncConnection.run_sync) """
+
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """))
+
+    applied = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+
+        print(f"Применение миграции {version}: {name}")
+        migrate(conn)
+        conn.execute(
+            text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+            {"version": version, "name": name},
+        )
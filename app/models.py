@@ -1,14 +1,32 @@
 from sqlalchemy.orm import Mapped, mapped_column  # способ аннотации полей модели в алхимии 2.0, замена Column
-from sqlalchemy import Integer, String, Date, Float, DateTime
+from sqlalchemy import DDL, Integer, String, Date, Float, DateTime, Index, UniqueConstraint, event
 from app.base import Base
-from datetime import datetime
+from datetime import date, datetime
 
 
 class SpimexTradingResult(Base):
     """Модель для таблицы spimex_trading_results """
     __tablename__ = 'spimex_trading_results'
+    __table_args__ = (
+        # Один инструмент встречается в отчёте за день один раз, по этому ключу идёт upsert при загрузке
+        UniqueConstraint("date", "exchange_product_id", name="uq_spimex_trading_results_date_product"),
 
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+        # Индексы под сортировку (date, id) от новых к старым: с фильтрами API по равенству впереди.
+        # id в конце индекса нужен keyset-пагинации — условие (date, id) < (...) проверяется по индексу
+        Index("ix_spimex_trading_results_date_id", "date", "id"),
+        Index("ix_spimex_trading_results_oil_date_id", "oil_id", "date", "id"),
+        Index("ix_spimex_trading_results_basis_date_id", "delivery_basis_id", "date", "id"),
+        Index(
+            "ix_spimex_trading_results_oil_basis_type_date_id",
+            "oil_id", "delivery_basis_id", "delivery_type_id", "date", "id",
+        ),
+
+        # Помесячные партиции по date (app/partitions.py). Первичный и уникальный ключи
+        # секционированной таблицы обязаны включать date, поэтому первичный ключ — (id, date)
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     exchange_product_id: Mapped[str] = mapped_column(String, nullable=False)
     exchange_product_name: Mapped[str] = mapped_column(String, nullable=False)
     oil_id: Mapped[str] = mapped_column(String, nullable=False)
@@ -18,6 +36,50 @@ class SpimexTradingResult(Base):
     volume: Mapped[float] = mapped_column(Float, nullable=True)
     total: Mapped[float] = mapped_column(Float, nullable=True)
     count: Mapped[int] = mapped_column(Integer, nullable=True)
-    date: Mapped[str] = mapped_column(Date, nullable=False)
+    date: Mapped[str] = mapped_column(Date, primary_key=True)
     created_at: Mapped[str] = mapped_column(DateTime, default=datetime.now)
     updated_at: Mapped[str] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+# Строки месяцев, для которых ещё нет партиции, попадают в партицию по умолчанию
+event.listen(
+    SpimexTradingResult.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS spimex_trading_results_default PARTITION OF spimex_trading_results DEFAULT"),
+)
+
+
+class SpimexTradingDate(Base):
+    """Торговые дни, за которые есть строки в spimex_trading_results """
+    __tablename__ = 'spimex_trading_dates'
+
+    date: Mapped[str] = mapped_column(Date, primary_key=True)
+
+
+class SpimexDailyRollup(Base):
+    """Дневные суммы торгов по значению измерения (oil_id, delivery_basis_id, delivery_type_id) """
+    __tablename__ = 'spimex_daily_rollups'
+    __table_args__ = (
+        # Выборка по диапазону дат без фильтра по значению; с фильтром работает первичный ключ
+        Index("ix_spimex_daily_rollups_dimension_date", "dimension", "date"),
+    )
+
+    dimension: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[str] = mapped_column(String, primary_key=True)
+    date: Mapped[str] = mapped_column(Date, primary_key=True)
+    volume: Mapped[float] = mapped_column(Float, nullable=False)
+    total: Mapped[float] = mapped_column(Float, nullable=False)
+    count: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class SpimexReportLedger(Base):
+    """Журнал загруженных отчётов для инкрементальной загрузки """
+    __tablename__ = 'spimex_report_ledger'
+
+    report_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    url: Mapped[str] = mapped_column(String, primary_key=True)
+    etag: Mapped[str] = mapped_column(String, nullable=True)
+    last_modified: Mapped[str] = mapped_column(String, nullable=True)
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    row_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    ingested_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -0,0 +1,54 @@
+"""
+Значения кэша GET-эндпоинтов: ключи и расчёт из БД.
+
+Их используют эндпоинты при промахе кэша и прогрев кэша после загрузки, поэтому они
+лежат ниже app.routes и app.services и не зависят от FastAPI.
+"""
+from typing import Optional
+
+from app.repositories import get_dynamics_query, get_trading_dates_query, get_trading_results_query, next_cursor
+from app.schemas import dump_trading_results, trading_dates_adapter
+
+
+def pack_page(body: bytes, cursor: Optional[str]) -> bytes:
+    """ Значение кэша для страницы списка: курсор (base64 без переводов строк), перевод строки, тело ответа """
+
+    return (cursor or "").encode() + b"\n" + body
+
+
+def dynamics_cache_key(start_date, end_date, filters: dict, limit: int, offset: int, cursor: Optional[str]) -> str:
+    """ Ключ кэша страницы get_dynamics """
+
+    return (
+        f"get_dynamics:{start_date}:{end_date}:{filters['oil_id']}:{filters['delivery_type_id']}:"
+        f"{filters['delivery_basis_id']}:{limit}:{offset}:{cursor}"
+    )
+
+
+def trading_results_cache_key(filters: dict, limit: int, offset: int, cursor: Optional[str]) -> str:
+    """ Ключ кэша страницы get_trading_results """
+
+    return (
+        f"get_trading_results:{filters['oil_id']}:{filters['delivery_type_id']}:{filters['delivery_basis_id']}:"
+        f"{limit}:{offset}:{cursor}"
+    )
+
+
+async def load_trading_dates(db) -> bytes:
+    """ Значение кэша get_last_trading_dates: все торговые дни """
+
+    return trading_dates_adapter.dump_json(await get_trading_dates_query(db))
+
+
+async def load_dynamics_page(db, start_date, end_date, filters: dict, limit: int, offset: int, cursor=None) -> bytes:
+    """ Значение кэша страницы get_dynamics из БД """
+
+    data = await get_dynamics_query(db, start_date, end_date, filters, limit, offset, cursor)
+    return pack_page(dump_trading_results(data), next_cursor(data, limit))
+
+
+async def load_trading_results_page(db, filters: dict, limit: int, offset: int, cursor=None) -> bytes:
+    """ Значение кэша страницы get_trading_results из БД """
+
+    data = await get_trading_results_query(db, filters, limit, offset, cursor)
+    return pack_page(dump_trading_results(data), next_cursor(data, limit))
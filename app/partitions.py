@@ -0,0 +1,189 @@
+"""
+Помесячные партиции spimex_trading_results.
+
+Таблица секционирована по диапазону date. Партиция месяца создаётся при загрузке
+первого отчёта за этот месяц, строки месяцев без партиции лежат в партиции по умолчанию.
+Запросы по диапазону дат читают только партиции нужных месяцев, а старые месяцы
+архивируются отсоединением или удалением партиций вместо DELETE по всей таблице.
+
+    python -m app.partitions create 01-01-2020 31-12-2025
+    python -m app.partitions drop-before 01-01-2022 --detach
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.cache import bump_cache_version
+from app.cli import parse_date
+from app.models import SpimexDailyRollup, SpimexTradingDate, SpimexTradingResult
+
+TABLE = SpimexTradingResult.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+# Ключ pg_advisory_xact_lock: партиции одновременно создаёт или удаляет только один процесс
+PARTITIONS_LOCK_KEY = 7_320_002
+
+PARTITIONS_SQL = text("""
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = CAST(:table AS regclass)
+""")
+
+# Партиции, существование которых уже проверено этим процессом
+known_partitions = set()
+
+
+def month_start(day):
+    """ Первый день месяца даты """
+
+    return day.replace(day=1)
+
+
+def next_month(month):
+    """ Первый день следующего месяца """
+
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(month):
+    """ Имя партиции месяца: spimex_trading_results_y2025m04 """
+
+    return f"{TABLE}_y{month:%Y}m{month:%m}"
+
+
+def partition_month(name):
+    """ Месяц партиции по её имени (None для партиции по умолчанию) """
+
+    if name == DEFAULT_PARTITION:
+        return None
+    return datetime.strptime(name[len(TABLE) + 1:], "y%Ym%m").date()
+
+
+def create_partition_statements(month):
+    """
+    Создание партиции месяца. Если строки месяца уже лежат в партиции по умолчанию,
+    подключить партицию поверх них нельзя, поэтому сначала они переносятся в новую таблицу
+    """
+
+    name = partition_name(month)
+    lower, upper = month.isoformat(), next_month(month).isoformat()
+    return [
+        text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)"),
+        text(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE date >= '{lower}' AND date < '{upper}' RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """),
+        text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"),
+    ]
+
+
+async def get_partitions(db):
+    """ Имена партиций spimex_trading_results """
+
+    result = await db.execute(PARTITIONS_SQL, {"table": TABLE})
+    return set(result.scalars().all())
+
+
+async def ensure_partitions(db, dates):
+    """ Создаёт партиции месяцев, в которые попадают даты dates, и фиксирует транзакцию """
+
+    months = sorted({month_start(day) for day in dates})
+    missing = [month for month in months if partition_name(month) not in known_partitions]
+    if not missing:
+        return []
+
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITIONS_LOCK_KEY})
+    # Перенос строк из партиции по умолчанию и удаление месяцев не укладываются в statement_timeout API
+    await db.execute(text("SET LOCAL statement_timeout = 0"))
+    existing = await get_partitions(db)
+
+    created = []
+    for month in missing:
+        if partition_name(month) in existing:
+            continue
+        for stmt in create_partition_statements(month):
+            await db.execute(stmt)
+        created.append(partition_name(month))
+        print(f"Создана партиция {partition_name(month)}")
+
+    await db.commit()
+    known_partitions.update(existing, created)
+    return created
+
+
+async def drop_partitions_before(db, before, detach: bool = False):
+    """
+    Удаляет (или отсоединяет при detach=True) партиции месяцев раньше месяца даты before.
+    Отсоединённая партиция остаётся обычной таблицей, её можно выгрузить и удалить отдельно.
+    Дневные суммы и торговые дни этих месяцев удаляются, версия данных кэша меняется. Возвращает имена партиций
+    """
+
+    bound = month_start(before)
+
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITIONS_LOCK_KEY})
+    # Перенос строк из партиции по умолчанию и удаление месяцев не укладываются в statement_timeout API
+    await db.execute(text("SET LOCAL statement_timeout = 0"))
+    old = sorted(
+        name for name in await get_partitions(db)
+        if partition_month(name) is not None and partition_month(name) < bound
+    )
+
+    for name in old:
+        if detach:
+            await db.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        else:
+            await db.execute(text(f"DROP TABLE {name}"))
+
+        month = partition_month(name)
+        for model in (SpimexDailyRollup, SpimexTradingDate):
+            await db.execute(
+                model.__table__.delete().where(model.date >= month, model.date < next_month(month))
+            )
+        print(f"Партиция {name} {'отсоединена' if detach else 'удалена'}")
+
+    await db.commit()
+    known_partitions.difference_update(old)
+    if old:
+        # Строки удалённых месяцев пропали из ответов: закэшированные до этого ответы больше не читаются
+        try:
+            await bump_cache_version()
+        except Exception as e:
+            print(f"Не удалось сменить версию данных кэша: {e}")
+    return old
+
+
+async def main():
+    from app.database import AsyncSessionLocal, create_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="Создать партиции месяцев периода")
+    create.add_argument("start_date", type=parse_date, help="Начальная дата (DD-MM-YYYY)")
+    create.add_argument("end_date", type=parse_date, help="Конечная дата (DD-MM-YYYY)")
+
+    drop = commands.add_parser("drop-before", help="Удалить партиции месяцев раньше даты")
+    drop.add_argument("before", type=parse_date, help="Дата (DD-MM-YYYY), её месяц сохраняется")
+    drop.add_argument("--detach", action="store_true", help="Отсоединить партиции вместо удаления")
+    args = parser.parse_args()
+
+    await create_db()
+    async with AsyncSessionLocal() as db:
+        if args.command == "create":
+            months = []
+            month = month_start(args.start_date)
+            while month <= args.end_date:
+                months.append(month)
+                month = next_month(month)
+            await ensure_partitions(db, months)
+        else:
+            await drop_partitions_before(db, args.before, args.detach)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,48 +1,351 @@
+import base64
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import Date, String, cast, delete, func, literal, literal_column, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.models import SpimexTradingResult
+from app.config import CONFLICT_POLICIES
+from app.models import SpimexDailyRollup, SpimexReportLedger, SpimexTradingDate, SpimexTradingResult
+
+# Столбцы, которые перезаписываются при политике "update"
+UPSERT_UPDATE_COLUMNS = (
+    "exchange_product_name",
+    "oil_id",
+    "delivery_basis_id",
+    "delivery_basis_name",
+    "delivery_type_id",
+    "volume",
+    "total",
+    "count",
+)
+
+# Измерения, по которым ведутся дневные суммы, и шаги группировки по датам для агрегатов
+ROLLUP_DIMENSIONS = ("oil_id", "delivery_basis_id", "delivery_type_id")
+AGGREGATE_BUCKETS = ("day", "week", "month")
+
+# Столбцы ответа API: списки выбираются ими как строки Core, без загрузки ORM-объектов
+RESPONSE_COLUMNS = (
+    SpimexTradingResult.id,
+    SpimexTradingResult.exchange_product_id,
+    SpimexTradingResult.exchange_product_name,
+    SpimexTradingResult.oil_id,
+    SpimexTradingResult.delivery_basis_id,
+    SpimexTradingResult.delivery_basis_name,
+    SpimexTradingResult.delivery_type_id,
+    SpimexTradingResult.volume,
+    SpimexTradingResult.total,
+    SpimexTradingResult.count,
+    SpimexTradingResult.date,
+)
+
+
+def encode_cursor(trade_date, row_id: int) -> str:
+    """ Непрозрачный курсор страницы: ключ (date, id) последней строки """
+
+    raw = f"{trade_date.isoformat()}:{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """ Ключ (date, id) из курсора, ValueError при неверном курсоре """
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        trade_date, row_id = raw.split(":")
+        return date.fromisoformat(trade_date), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Неверный курсор")
+
+
+def paginate(query, limit: int, offset: int, cursor: Optional[str] = None):
+    """
+    Сортировка по (date, id) от новых к старым и пагинация
+    - с курсором — keyset: строки после (date, id) из курсора, offset не используется
+    - без курсора — offset/limit, как раньше
+    """
+
+    query = query.order_by(SpimexTradingResult.date.desc(), SpimexTradingResult.id.desc())
 
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.where(
+            # Отдельное условие по дате: сравнение кортежей планировщик не использует для отсечения партиций
+            SpimexTradingResult.date <= cursor_date,
+            tuple_(SpimexTradingResult.date, SpimexTradingResult.id) < tuple_(cursor_date, cursor_id),
+        )
+        return query.limit(limit)
 
-async def get_trading_results_query(db: AsyncSession, filters: dict, limit: int, offset: int):
-    """ Получение торговых результатов с фильтрацией """
+    return query.offset(offset).limit(limit)
 
-    query = select(SpimexTradingResult).order_by(SpimexTradingResult.date.desc())
+
+def next_cursor(items: list, limit: int) -> Optional[str]:
+    """ Курсор следующей страницы или None, если страница последняя """
+
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor(last.date, last.id)
+
+
+def build_trading_results_query(filters: dict, limit: int, offset: int, cursor: Optional[str] = None):
+    """ Запрос последних торгов с фильтрацией (без выполнения) """
+
+    query = select(*RESPONSE_COLUMNS)
 
     for attr, value in filters.items():
         if value is not None:  # исключение None значении
             query = query.where(getattr(SpimexTradingResult, attr) == value)  # динамическое получение поля из модели
 
     # Пагинация
-    query = query.offset(offset).limit(limit)
-
-    result = await db.execute(query)
-    return result.scalars().all()
+    return paginate(query, limit, offset, cursor)
 
 
-async def get_dynamics_query(
+async def get_trading_results_query(
         db: AsyncSession,
-        start_date: str,
-        end_date: str,
         filters: dict,
         limit: int,
-        offset: int
+        offset: int,
+        cursor: Optional[str] = None
 ):
-    """ Получает список торгов за заданный период """
+    """ Получение торговых результатов с фильтрацией (строки со столбцами RESPONSE_COLUMNS) """
+
+    result = await db.execute(build_trading_results_query(filters, limit, offset, cursor))
+    return result.all()
 
-    query = select(SpimexTradingResult).where(
+
+def dynamics_conditions(start_date, end_date, filters: dict):
+    """ Условия выборки торгов за период с фильтрами (общие для страниц и выгрузки) """
+
+    conditions = [
         SpimexTradingResult.date >= start_date,
         SpimexTradingResult.date <= end_date,
-    )
+    ]
 
     if filters["oil_id"]:
-        query = query.where(SpimexTradingResult.oil_id == filters["oil_id"])
+        conditions.append(SpimexTradingResult.oil_id == filters["oil_id"])
     if filters["delivery_type_id"]:
-        query = query.where(SpimexTradingResult.delivery_type_id == filters["delivery_type_id"])
+        conditions.append(SpimexTradingResult.delivery_type_id == filters["delivery_type_id"])
     if filters["delivery_basis_id"]:
-        query = query.where(SpimexTradingResult.delivery_basis_id == filters["delivery_basis_id"])
+        conditions.append(SpimexTradingResult.delivery_basis_id == filters["delivery_basis_id"])
+    return conditions
+
+
+def build_dynamics_query(start_date, end_date, filters: dict, limit: int, offset: int, cursor: Optional[str] = None):
+    """ Запрос торгов за период с фильтрацией (без выполнения) """
+
+    query = select(*RESPONSE_COLUMNS).where(*dynamics_conditions(start_date, end_date, filters))
 
     # Пагинация
-    query = query.offset(offset).limit(limit)
+    return paginate(query, limit, offset, cursor)
 
-    result = await db.execute(query)
+
+def build_export_query(start_date, end_date, filters: dict):
+    """ Все торги за период с фильтрацией в хронологическом порядке — для выгрузки """
+
+    return (
+        select(*RESPONSE_COLUMNS)
+        .where(*dynamics_conditions(start_date, end_date, filters))
+        .order_by(SpimexTradingResult.date, SpimexTradingResult.id)
+    )
+
+
+async def get_dynamics_query(
+        db: AsyncSession,
+        start_date: str,
+        end_date: str,
+        filters: dict,
+        limit: int,
+        offset: int,
+        cursor: Optional[str] = None
+):
+    """ Получает список торгов за заданный период (строки со столбцами RESPONSE_COLUMNS) """
+
+    result = await db.execute(build_dynamics_query(start_date, end_date, filters, limit, offset, cursor))
+    return result.all()
+
+
+async def upsert_trading_results(db: AsyncSession, records: list[dict], on_conflict: str = "skip"):
+    """
+    Записывает строки отчёта одним пакетным INSERT ... ON CONFLICT по (date, exchange_product_id)
+    - `on_conflict="skip"` — существующие строки не трогаются
+    - `on_conflict="update"` — существующие строки перезаписываются, если данные изменились
+
+    Возвращает количество вставленных, обновлённых и пропущенных строк
+    """
+
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError(f"Неизвестная политика конфликтов '{on_conflict}', допустимые: {CONFLICT_POLICIES}")
+
+    # Один INSERT ... ON CONFLICT DO UPDATE не может затронуть строку дважды,
+    # поэтому повторы ключа внутри отчёта схлопываются (побеждает последняя строка)
+    unique_records = {(record["date"], record["exchange_product_id"]): record for record in records}
+    rows = list(unique_records.values())
+
+    counts = {"inserted": 0, "updated": 0, "skipped": len(records) - len(rows)}
+    if not rows:
+        return counts
+
+    table = SpimexTradingResult.__table__
+    stmt = insert(table)
+    conflict_key = ["date", "exchange_product_id"]
+
+    if on_conflict == "skip":
+        stmt = stmt.on_conflict_do_nothing(index_elements=conflict_key)
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=conflict_key,
+            set_={**{column: stmt.excluded[column] for column in UPSERT_UPDATE_COLUMNS}, "updated_at": datetime.now()},
+            # Неизменившиеся строки не переписываются и считаются пропущенными
+            where=or_(*[table.c[column].is_distinct_from(stmt.excluded[column]) for column in UPSERT_UPDATE_COLUMNS]),
+        )
+
+    # xmax = 0 только у только что вставленных строк, у обновлённых он равен id текущей транзакции
+    stmt = stmt.returning(literal_column("xmax = 0").label("inserted"))
+
+    result = await db.execute(stmt, rows)
+    written = result.scalars().all()
+
+    counts["inserted"] = sum(1 for inserted in written if inserted)
+    counts["updated"] = len(written) - counts["inserted"]
+    counts["skipped"] += len(rows) - len(written)
+    return counts
+
+
+async def add_trading_dates(db: AsyncSession, dates) -> int:
+    """ Добавляет дни загруженного отчёта в справочник торговых дней. Возвращает количество новых дней """
+
+    rows = [{"date": trade_date} for trade_date in set(dates)]
+    if not rows:
+        return 0
+
+    stmt = insert(SpimexTradingDate.__table__).on_conflict_do_nothing(index_elements=["date"])
+    result = await db.execute(stmt.returning(SpimexTradingDate.__table__.c.date), rows)
+    return len(result.all())
+
+
+async def rebuild_trading_dates(db: AsyncSession):
+    """ Пересобирает справочник торговых дней по spimex_trading_results (после удаления данных в обход загрузки) """
+
+    await db.execute(delete(SpimexTradingDate))
+    await db.execute(
+        insert(SpimexTradingDate.__table__).from_select(["date"], select(SpimexTradingResult.date).distinct())
+    )
+
+
+async def get_trading_dates_query(db: AsyncSession):
+    """ Все торговые дни от новых к старым (из справочника, без обращения к таблице торгов) """
+
+    result = await db.execute(select(SpimexTradingDate.date).order_by(SpimexTradingDate.date.desc()))
     return result.scalars().all()
+
+
+def build_rollup_refresh_statements(dates=None):
+    """ Запросы пересчёта дневных сумм за дни dates (или целиком): удаление и вставка из spimex_trading_results """
+
+    table = SpimexDailyRollup.__table__
+    results = SpimexTradingResult
+
+    clear = delete(table)
+    if dates is not None:
+        clear = clear.where(table.c.date.in_(dates))
+    statements = [clear]
+
+    for dimension in ROLLUP_DIMENSIONS:
+        column = getattr(results, dimension)
+        source = select(
+            cast(literal(dimension), String),
+            column,
+            results.date,
+            func.coalesce(func.sum(results.volume), 0),
+            func.coalesce(func.sum(results.total), 0),
+            func.coalesce(func.sum(results.count), 0),
+        ).group_by(column, results.date)
+        if dates is not None:
+            source = source.where(results.date.in_(dates))
+
+        statements.append(
+            insert(table).from_select(["dimension", "value", "date", "volume", "total", "count"], source)
+        )
+    return statements
+
+
+async def refresh_daily_rollups(db: AsyncSession, dates=None):
+    """ Пересчитывает дневные суммы за дни dates (None — за всю историю) """
+
+    if dates is not None:
+        dates = list(set(dates))
+        if not dates:
+            return
+
+    for stmt in build_rollup_refresh_statements(dates):
+        await db.execute(stmt)
+
+
+def build_aggregates_query(group_by: str, bucket: str, start_date, end_date, value: Optional[str] = None):
+    """ Суммы и средневзвешенная цена по значениям измерения group_by с шагом bucket (из дневных сумм) """
+
+    if group_by not in ROLLUP_DIMENSIONS:
+        raise ValueError(f"Неизвестное измерение '{group_by}', допустимые: {ROLLUP_DIMENSIONS}")
+    if bucket not in AGGREGATE_BUCKETS:
+        raise ValueError(f"Неизвестный шаг '{bucket}', допустимые: {AGGREGATE_BUCKETS}")
+
+    rollup = SpimexDailyRollup
+    # Шаг подставляется в SQL литералом: одинаковое выражение в SELECT и GROUP BY без разных параметров
+    bucket_start = cast(func.date_trunc(literal_column(f"'{bucket}'"), rollup.date), Date)
+    volume = func.sum(rollup.volume)
+    total = func.sum(rollup.total)
+
+    query = select(
+        bucket_start.label("date"),
+        rollup.value,
+        volume.label("volume"),
+        total.label("total"),
+        func.sum(rollup.count).label("count"),
+        (total / func.nullif(volume, 0)).label("vwap"),
+    ).where(
+        rollup.dimension == group_by,
+        rollup.date >= start_date,
+        rollup.date <= end_date,
+    )
+    if value is not None:
+        query = query.where(rollup.value == value)
+
+    return query.group_by(bucket_start, rollup.value).order_by(bucket_start, rollup.value)
+
+
+async def get_aggregates_query(
+        db: AsyncSession,
+        group_by: str,
+        bucket: str,
+        start_date,
+        end_date,
+        value: Optional[str] = None
+):
+    """ Агрегаты торгов за период (строки date, value, volume, total, count, vwap) """
+
+    result = await db.execute(build_aggregates_query(group_by, bucket, start_date, end_date, value))
+    return result.all()
+
+
+async def get_report_ledger(db: AsyncSession, since=None):
+    """ Записи журнала загруженных отчётов: url -> запись (начиная с даты since, если задана) """
+
+    query = select(SpimexReportLedger)
+    if since is not None:
+        query = query.where(SpimexReportLedger.report_date >= since)
+
+    result = await db.execute(query)
+    return {entry.url: entry for entry in result.scalars().all()}
+
+
+async def upsert_report_ledger(db: AsyncSession, entry: dict):
+    """ Добавляет или обновляет запись журнала для загруженного отчёта """
+
+    stmt = insert(SpimexReportLedger.__table__).values(**entry, ingested_at=datetime.now())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["report_date", "url"],
+        set_={column: stmt.excluded[column] for column in (*entry, "ingested_at") if column not in ("report_date", "url")},
+    )
+    await db.execute(stmt)
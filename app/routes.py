@@ -1,20 +1,79 @@
-from fastapi import APIRouter, Depends, BackgroundTasks, Query
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
+from fastapi import APIRouter, Depends, BackgroundTasks, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 
-from app.cache import get_cached_data, set_cached_data
-from app.database import get_db
+from app.backfill import backfill
+from app.cache import TRADING_DATES_CACHE_KEY, get_cached_data, record_hit, set_cached_data, single_flight
+from app.config import DOWNLOAD_WORKERS
+from app.database import get_pool_stats, read_session, replica_engines
+from app.export import EXPORT_FORMATS, parquet_available, stream_export
+from app.pages import (
+    dynamics_cache_key,
+    load_dynamics_page,
+    load_trading_dates,
+    load_trading_results_page,
+    trading_results_cache_key,
+)
 from datetime import date
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from app.models import SpimexTradingResult
-from app.repositories import get_trading_results_query, get_dynamics_query
+from app.repositories import (
+    build_export_query,
+    decode_cursor,
+    get_aggregates_query,
+)
 from app.services import fetch_and_parse_data
-from app.schemas import SpimexTradingResultResponse, SpimexTradingResultQuery
+from app.schemas import (
+    SpimexAggregateResponse,
+    SpimexTradingResultResponse,
+    SpimexTradingResultQuery,
+    dump_aggregates,
+)
 
 
 router = APIRouter(prefix="", tags=["Эндпоинты"])
 
+# Заголовок ответа с курсором следующей страницы
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def validate_cursor(cursor: Optional[str]):
+    """ Проверка курсора до обращения к кэшу и БД """
+
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+
+def json_response(body: bytes, cursor: Optional[str] = None) -> Response:
+    """
+    Готовое JSON-тело без повторной проверки по response_model.
+    Курсор следующей страницы — в заголовке (если страница не последняя)
+    """
+
+    headers = {NEXT_CURSOR_HEADER: cursor} if cursor else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def first_dates_body(body: bytes, count: int) -> bytes:
+    """
+    Первые count дат из JSON-массива дат без разбора: каждый элемент — "YYYY-MM-DD"
+    и разделитель, то есть ровно 13 байт, поэтому нужный префикс вырезается по длине
+    """
+
+    if count <= 0:
+        return b"[]"
+    if count * 13 >= len(body) - 1:
+        return body
+    return body[:count * 13] + b"]"
+
+
+def cached_page_response(value: bytes) -> Response:
+    """ Ответ из значения кэша страницы без разбора тела """
+
+    cursor, _, body = value.partition(b"\n")
+    return json_response(body, cursor.decode() or None)
 
 
 @router.post("/fetch_data/")
@@ -28,32 +87,46 @@ async def fetch_data(
     return {"message": f"Процесс скачивания и парсинга запущен на фоне для {n} файлов"}
 
 
+@router.post("/backfill/")
+async def backfill_data(
+        background_tasks: BackgroundTasks,
+        query: SpimexTradingResultQuery = Depends(),
+        workers: int = Query(DOWNLOAD_WORKERS, ge=1, le=32, description="Количество параллельных скачиваний"),
+):
+    """
+    Запускает загрузку истории за период в фоне, уже загруженные дни пропускаются
+    - `start_date` (формат: DD-MM-YYYY) — начальная дата
+    - `end_date` (формат: DD-MM-YYYY) — конечная дата
+    """
+
+    if query.start_date > query.end_date:
+        raise HTTPException(status_code=400, detail="Начальная дата больше конечной")
+
+    background_tasks.add_task(backfill, query.start_date, query.end_date, workers)
+    return {"message": f"Загрузка истории за {query.start_date} — {query.end_date} запущена на фоне"}
+
+
 @router.get("/get_last_trading_dates/", response_model=List[date])
 async def get_last_trading_dates(
         count: int = Query(description="Количество дней для поиска"),
-        db: AsyncSession = Depends(get_db)
 ):
-    """ Возвращает список последних торговых дней из БД с кэшированием """
+    """
+    Возвращает список последних торговых дней из справочника торговых дней с кэшированием.
+    В кэше один ключ со всеми днями, ответ на любой count — его начало
+    """
 
-    cache_key = f"last_trading_dates:{count}"
-    cached_data = await get_cached_data(cache_key)
+    body = await get_cached_data(TRADING_DATES_CACHE_KEY)
 
-    if cached_data:
-        return cached_data
+    if body is None:
+        async def load():
+            async with read_session() as db:
+                value = await load_trading_dates(db)
+            await set_cached_data(TRADING_DATES_CACHE_KEY, value)
+            return value
 
-    result = await db.execute(
-        select(SpimexTradingResult.date)
-        .distinct()
-        .order_by(SpimexTradingResult.date.desc())
-        .limit(count)
-    )
-    data = [row[0] for row in result.all()]
+        body = await single_flight(TRADING_DATES_CACHE_KEY, load)
 
-    if not data:
-        await set_cached_data(cache_key, [])
-    else:
-        await set_cached_data(cache_key, data)
-    return data
+    return json_response(first_dates_body(body, count))
 
 
 @router.get("/get_dynamics/", response_model=List[SpimexTradingResultResponse])
@@ -64,13 +137,15 @@ async def get_dynamics(
         delivery_basis_id: Optional[str] = None,
         limit: int = Query(10, le=100, description="Количество данных на одной странице"),
         offset: int = Query(0, description="С какой записи начать выборку данных"),
-        db: AsyncSession = Depends(get_db),
+        cursor: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
 ):
     """
     Список торгов за заданный период с кэшированием
     - `start_date` (формат: DD-MM-YYYY) — начальная дата выборки
     - `end_date` (формат: DD-MM-YYYY) — конечная дата выборки
+    - `cursor` — курсор из заголовка `X-Next-Cursor` предыдущей страницы, при нём `offset` не используется
     """
+    validate_cursor(cursor)
     start_date = query.start_date
     end_date = query.end_date
 
@@ -80,17 +155,26 @@ async def get_dynamics(
         "delivery_basis_id": delivery_basis_id,
     }
 
-    cache_key = f"get_dynamics:{start_date}:{end_date}:{oil_id}:{delivery_type_id}:{delivery_basis_id}:{limit}:{offset}"
+    if cursor is None:
+        record_hit("get_dynamics", {
+            "start_date": start_date.isoformat(), "end_date": end_date.isoformat(),
+            "filters": filters, "limit": limit, "offset": offset,
+        })
+
+    cache_key = dynamics_cache_key(start_date, end_date, filters, limit, offset, cursor)
     cached_data = await get_cached_data(cache_key)
 
-    if cached_data:
-        return cached_data
+    if cached_data is None:
+        # Одновременные промахи по этому ключу ждут один запрос к БД
+        async def load():
+            async with read_session() as db:
+                value = await load_dynamics_page(db, start_date, end_date, filters, limit, offset, cursor)
+            await set_cached_data(cache_key, value)
+            return value
 
-    data = await get_dynamics_query(db, start_date, end_date, filters, limit, offset)
-    data_pydantic = [SpimexTradingResultResponse.model_validate(item) for item in data]
+        cached_data = await single_flight(cache_key, load)
 
-    await set_cached_data(cache_key, [item.model_dump() for item in data_pydantic])
-    return data_pydantic
+    return cached_page_response(cached_data)
 
 
 @router.get("/get_trading_results/", response_model=List[SpimexTradingResultResponse])
@@ -100,9 +184,13 @@ async def get_trading_results(
         delivery_basis_id: Optional[str] = None,
         limit: int = Query(10, le=100, description="Количество данных на одной странице"),
         offset: int = Query(0, description="С какой записи начать выборку данных"),
-        db: AsyncSession = Depends(get_db),
+        cursor: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
 ):
-    """ Список последних торгов с кэшированием """
+    """
+    Список последних торгов с кэшированием
+    - `cursor` — курсор из заголовка `X-Next-Cursor` предыдущей страницы, при нём `offset` не используется
+    """
+    validate_cursor(cursor)
 
     filters = {
         "oil_id": oil_id,
@@ -110,15 +198,103 @@ async def get_trading_results(
         "delivery_basis_id": delivery_basis_id,
     }
 
-    cache_key = f"get_trading_results:{oil_id}:{delivery_type_id}:{delivery_basis_id}:{limit}:{offset}"
+    if cursor is None:
+        record_hit("get_trading_results", {"filters": filters, "limit": limit, "offset": offset})
+
+    cache_key = trading_results_cache_key(filters, limit, offset, cursor)
+    cached_data = await get_cached_data(cache_key)
+
+    if cached_data is None:
+        # Если данных нет в кэше, загружаем их из БД и кэшируем (один запрос на все одновременные промахи)
+        async def load():
+            async with read_session() as db:
+                value = await load_trading_results_page(db, filters, limit, offset, cursor)
+            await set_cached_data(cache_key, value)
+            return value
+
+        cached_data = await single_flight(cache_key, load)
+
+    return cached_page_response(cached_data)
+
+
+@router.get("/get_aggregates/", response_model=List[SpimexAggregateResponse])
+async def get_aggregates(
+        query: SpimexTradingResultQuery = Depends(),
+        group_by: Literal["oil_id", "delivery_basis_id", "delivery_type_id"] = Query(
+            "oil_id", description="Измерение группировки"
+        ),
+        bucket: Literal["day", "week", "month"] = Query("day", description="Шаг группировки по датам"),
+        value: Optional[str] = Query(None, description="Только одно значение измерения"),
+):
+    """
+    Суммы объёма, оборота и количества договоров и средневзвешенная цена (total / volume)
+    по значениям измерения за каждый день, неделю или месяц периода с кэшированием.
+    Считаются по дневным суммам, которые обновляются при загрузке отчётов
+    - `start_date` (формат: DD-MM-YYYY) — начальная дата
+    - `end_date` (формат: DD-MM-YYYY) — конечная дата
+    """
+
+    if query.start_date > query.end_date:
+        raise HTTPException(status_code=400, detail="Начальная дата больше конечной")
+
+    cache_key = f"get_aggregates:{query.start_date}:{query.end_date}:{group_by}:{bucket}:{value}"
     cached_data = await get_cached_data(cache_key)
 
-    if cached_data:
-        return cached_data
+    if cached_data is None:
+        async def load():
+            async with read_session() as db:
+                rows = await get_aggregates_query(db, group_by, bucket, query.start_date, query.end_date, value)
+            body = dump_aggregates(rows)
+            await set_cached_data(cache_key, body)
+            return body
+
+        cached_data = await single_flight(cache_key, load)
+
+    return json_response(cached_data)
 
-    # Если данных нет в кэше, загружаем их из БД и кэшируем
-    data = await get_trading_results_query(db, filters, limit, offset)
-    data_pydantic = [SpimexTradingResultResponse.model_validate(item) for item in data]
 
-    await set_cached_data(cache_key, [item.model_dump() for item in data_pydantic])
-    return data_pydantic
+@router.get("/export/")
+async def export_trading_results(
+        query: SpimexTradingResultQuery = Depends(),
+        oil_id: Optional[str] = None,
+        delivery_type_id: Optional[str] = None,
+        delivery_basis_id: Optional[str] = None,
+        export_format: Literal["csv", "ndjson", "parquet"] = Query("csv", alias="format", description="Формат выгрузки"),
+):
+    """
+    Потоковая выгрузка всех торгов за период с фильтрами как у get_dynamics, без пагинации
+    - `start_date` (формат: DD-MM-YYYY) — начальная дата выборки
+    - `end_date` (формат: DD-MM-YYYY) — конечная дата выборки
+    - `format` — csv, ndjson или parquet (для parquet нужен pyarrow)
+    """
+
+    if query.start_date > query.end_date:
+        raise HTTPException(status_code=400, detail="Начальная дата больше конечной")
+    if export_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Выгрузка в Parquet недоступна: не установлен pyarrow")
+
+    filters = {
+        "oil_id": oil_id,
+        "delivery_type_id": delivery_type_id,
+        "delivery_basis_id": delivery_basis_id,
+    }
+
+    media_type, extension = EXPORT_FORMATS[export_format]
+    filename = f"spimex_trading_results_{query.start_date}_{query.end_date}.{extension}"
+    return StreamingResponse(
+        stream_export(build_export_query(query.start_date, query.end_date, filters), export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/db_pool_stats/")
+async def db_pool_stats():
+    """
+    Состояние пула соединений основной БД (и каждой реплики в `replicas`): занятые и свободные соединения,
+    среднее и максимальное ожидание соединения (мс) и число таймаутов с запуска процесса
+    """
+
+    stats = get_pool_stats()
+    stats["replicas"] = [get_pool_stats(replica.sync_engine.pool) for replica in replica_engines]
+    return stats
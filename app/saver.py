@@ -1,59 +1,269 @@
+import asyncio
+import io
 import os
+import re
 import aiohttp
 
 from datetime import datetime, timedelta
 
+from app.config import (
+    DISCOVERY_CONCURRENCY,
+    DISCOVERY_DAYS,
+    DISCOVERY_TIMEOUT,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_TIMEOUT,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_LIMIT_PER_HOST,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_RETRIES,
+    HTTP_RETRY_BACKOFF,
+    SPIMEX_BASE_URL,
+)
+
 SAVE_DIR = "spimex_reports"
-os.makedirs(SAVE_DIR, exist_ok=True)
 
-BASE_URL = "https://spimex.com/upload/reports/oil_xls/oil_xls_"
+BASE_URL = SPIMEX_BASE_URL
 
+# Статусы временной недоступности, при которых запрос повторяется
+RETRY_STATUSES = {429, 502, 503, 504}
 
-async def find_latest_spimex_report(n):
-    """ Ищет последний доступный файл, начиная с текущей даты и двигаясь назад """
-    today = datetime.today()
-    found_files = []
+http_session = None
+
+
+class RetryableStatusError(Exception):
+    """ Сервер временно недоступен, запрос стоит повторить """
+
+
+def get_http_session():
+    """ Общий HTTP-клиент с пулом keep-alive соединений, создаётся при первом обращении """
+
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_MAX_CONNECTIONS,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        http_session = aiohttp.ClientSession(connector=connector)
+    return http_session
 
-    async with aiohttp.ClientSession() as session:
-        for i in range(30):
-            date_str = (today - timedelta(days=i)).strftime("%Y%m%d")
-            report_url = f"{BASE_URL}{date_str}162000.xls"
 
-            print(f"Проверка файла: {report_url}")
+async def init_http_session():
+    """ Открывает HTTP-клиент на время жизни приложения """
 
-            try:
-                async with session.get(report_url, timeout=3) as response:
-                    if response.status == 200:
-                        print(f"Найден доступный файл: {report_url}")
-                        found_files.append(report_url)
-                        if len(found_files) >= n:
-                            break
-                    else:
-                        print(f"Файл {report_url} недоступен, статус: {response.status}")
-            except aiohttp.ClientError as e:
-                print(f"Ошибка при проверке файла {report_url}: {e}")
+    get_http_session()
 
-        return found_files if found_files else None
 
+async def close_http_session():
+    """ Закрывает HTTP-клиент и его соединения """
 
-async def download_spimex_report(report_url):
-    """ Скачивает последний найденный отчет """
+    global http_session
+    if http_session is not None:
+        await http_session.close()
+        http_session = None
 
-    filename = os.path.basename(report_url)
-    file_path = os.path.join(SAVE_DIR, filename)
 
-    async with aiohttp.ClientSession() as session:
+async def with_retries(operation, url):
+    """ Выполняет запрос, повторяя его при сетевых ошибках и временной недоступности сервера """
+
+    for attempt in range(HTTP_RETRIES + 1):
         try:
-            async with session.get(report_url, ssl=False, timeout=3) as response:
-                if response.status == 200:
-                    with open(file_path, "wb") as file:
-                        async for chunk in response.content.iter_chunked(1024):
-                            file.write(chunk)
-                    print(f"Файл сохранен: {file_path}")
-                    return file_path
+            return await operation()
+        except (aiohttp.ClientError, asyncio.TimeoutError, RetryableStatusError) as e:
+            if attempt == HTTP_RETRIES:
+                raise
+
+            delay = HTTP_RETRY_BACKOFF * 2 ** attempt
+            print(f"Повтор запроса {url} через {delay} сек. (попытка {attempt + 1}): {e!r}")
+            await asyncio.sleep(delay)
+
+
+def check_retryable(response):
+    """ Поднимает RetryableStatusError для статусов, при которых запрос стоит повторить """
+
+    if response.status in RETRY_STATUSES:
+        raise RetryableStatusError(f"статус {response.status}")
+
+
+def spimex_report_url(report_date):
+    """ URL отчёта за указанную дату """
+
+    return f"{BASE_URL}{report_date.strftime('%Y%m%d')}162000.xls"
+
+
+def report_date_from_url(report_url):
+    """ Дата отчёта из имени файла oil_xls_YYYYMMDD162000.xls """
+
+    match = re.search(r"oil_xls_(\d{8})", report_url)
+    if not match:
+        raise ValueError(f"Дата отчёта не найдена в URL {report_url}")
+    return datetime.strptime(match.group(1), "%Y%m%d").date()
+
+
+def is_report_unchanged(ledger_entry, validators):
+    """ Совпадают ли ETag или Last-Modified отчёта с записью журнала """
+
+    if ledger_entry is None or not validators:
+        return False
+    if validators.get("etag") and ledger_entry.etag:
+        return validators["etag"] == ledger_entry.etag
+    if validators.get("last_modified") and ledger_entry.last_modified:
+        return validators["last_modified"] == ledger_entry.last_modified
+    return False
+
+
+def conditional_headers(ledger_entry):
+    """ Заголовки условного запроса по данным журнала """
+
+    headers = {}
+    if ledger_entry is not None:
+        if ledger_entry.etag:
+            headers["If-None-Match"] = ledger_entry.etag
+        if ledger_entry.last_modified:
+            headers["If-Modified-Since"] = ledger_entry.last_modified
+    return headers
+
+
+def report_validators(headers):
+    """ ETag и Last-Modified отчёта из заголовков ответа """
+
+    return {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+
+
+async def probe_spimex_report(report_url, semaphore, validators=None):
+    """ Проверяет доступность отчёта, не скачивая его. Заголовки найденного отчёта записываются в validators """
+
+    session = get_http_session()
+    timeout = aiohttp.ClientTimeout(total=DISCOVERY_TIMEOUT)
+
+    async def probe():
+        async with session.head(report_url, timeout=timeout) as response:
+            check_retryable(response)
+            status, headers = response.status, response.headers
+
+        # Сервер не поддерживает HEAD: запрашиваем только первый байт файла
+        if status in (405, 501):
+            range_headers = {"Range": "bytes=0-0"}
+            async with session.get(report_url, timeout=timeout, headers=range_headers) as response:
+                check_retryable(response)
+                status, headers = response.status, response.headers
+
+        return status, headers
+
+    async with semaphore:
+        print(f"Проверка файла: {report_url}")
+
+        try:
+            status, headers = await with_retries(probe, report_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError, RetryableStatusError) as e:
+            print(f"Ошибка при проверке файла {report_url}: {e}")
+            return False
+
+    if status not in (200, 206):
+        print(f"Файл {report_url} недоступен, статус: {status}")
+        return False
+
+    print(f"Найден доступный файл: {report_url}")
+    if validators is not None:
+        validators[report_url] = report_validators(headers)
+    return True
+
+
+async def find_latest_spimex_report(n, ledger=None, validators=None):
+    """
+    Ищет n последних доступных файлов, проверяя даты от текущей назад параллельно.
+    Отчёты из журнала ledger (url -> запись), которые не изменились на сервере,
+    учитываются в n, но не возвращаются. Заголовки найденных отчётов
+    записываются в validators (url -> {"etag": ..., "last_modified": ...}) вызывающего
+    """
+    if validators is None:
+        validators = {}
+    today = datetime.today()
+    report_urls = [spimex_report_url(today - timedelta(days=i)) for i in range(DISCOVERY_DAYS)]
+    found_files = []
+    found = 0
+
+    semaphore = asyncio.Semaphore(DISCOVERY_CONCURRENCY)
+    probes = [asyncio.create_task(probe_spimex_report(url, semaphore, validators)) for url in report_urls]
+
+    try:
+        # Результаты разбираются от новых дат к старым, поэтому порядок файлов сохраняется
+        for report_url, probe in zip(report_urls, probes):
+            if await probe:
+                found += 1
+                if ledger and is_report_unchanged(ledger.get(report_url), validators.get(report_url)):
+                    print(f"Файл {report_url} уже загружен и не изменился. Пропускаем.")
                 else:
-                    print(f"Ошибка скачивания: {response.status}")
-        except aiohttp.ClientError as e:
-            print(f"Ошибка при скачивании файла {report_url}: {e}")
+                    found_files.append(report_url)
+                if found >= n:
+                    break
+    finally:
+        # Более старые даты уже не нужны
+        for probe in probes:
+            probe.cancel()
+        await asyncio.gather(*probes, return_exceptions=True)
+
+    return found_files if found_files else None
+
+
+async def fetch_spimex_report(report_url, ledger_entry=None, validators=None, missing=None):
+    """
+    Скачивает отчёт в память и возвращает его содержимое. Для отчёта из журнала запрос условный:
+    если сервер ответил 304, файл не скачивается.
+    Заголовки скачанного отчёта записываются в validators, URL отчёта, которого нет
+    на сервере (404), — в missing; оба контейнера передаёт вызывающий на время одной загрузки
+    """
+
+    session = get_http_session()
+    timeout = aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)
+
+    async def fetch():
+        headers = conditional_headers(ledger_entry)
+        async with session.get(report_url, ssl=False, timeout=timeout, headers=headers) as response:
+            check_retryable(response)
+            if response.status == 304:
+                print(f"Файл {report_url} не изменился с прошлой загрузки")
+                return None
+            if response.status == 404:
+                print(f"Отчёта {report_url} нет на сервере")
+                if missing is not None:
+                    missing.add(report_url)
+                return None
+            if response.status != 200:
+                print(f"Ошибка скачивания: {response.status}")
+                return None
+
+            buffer = io.BytesIO()
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                buffer.write(chunk)
+
+            if validators is not None:
+                validators[report_url] = report_validators(response.headers)
+            return buffer.getvalue()
+
+    try:
+        return await with_retries(fetch, report_url)
+    except (aiohttp.ClientError, asyncio.TimeoutError, RetryableStatusError) as e:
+        print(f"Ошибка при скачивании файла {report_url}: {e}")
 
     return None
+
+
+def save_report_file(report_url, content):
+    """ Сохраняет содержимое отчёта в SAVE_DIR и возвращает путь к файлу """
+
+    os.makedirs(SAVE_DIR, exist_ok=True)
+    file_path = os.path.join(SAVE_DIR, os.path.basename(report_url))
+    with open(file_path, "wb") as file:
+        file.write(content)
+    print(f"Файл сохранен: {file_path}")
+    return file_path
+
+
+async def download_spimex_report(report_url, ledger_entry=None, validators=None, missing=None):
+    """ Скачивает последний найденный отчет и сохраняет его на диск """
+
+    content = await fetch_spimex_report(report_url, ledger_entry, validators, missing)
+    if content is None:
+        return None
+    return save_report_file(report_url, content)
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, TypeAdapter, field_validator
 from datetime import date, datetime
-from typing import Optional
+from typing import List, Optional
 
 
 class SpimexTradingResultBase(BaseModel):
@@ -26,6 +26,39 @@ class SpimexTradingResultResponse(SpimexTradingResultBase):
         from_attributes = True
 
 
+class SpimexAggregateResponse(BaseModel):
+    """Схема агрегата торгов: суммы по значению измерения за шаг дат и средневзвешенная цена """
+
+    value: str
+    volume: float
+    total: float
+    count: int
+    vwap: Optional[float] = None
+    date: date
+
+    class Config:
+        from_attributes = True
+
+
+trading_dates_adapter = TypeAdapter(List[date])
+aggregates_adapter = TypeAdapter(List[SpimexAggregateResponse])
+
+# Проверка и сериализация всего списка за один вызов pydantic-core вместо model_validate на каждую строку
+trading_results_adapter = TypeAdapter(List[SpimexTradingResultResponse])
+
+
+def dump_trading_results(rows) -> bytes:
+    """ JSON-тело ответа из строк БД (или любых объектов с атрибутами схемы) """
+
+    return trading_results_adapter.dump_json(trading_results_adapter.validate_python(rows, from_attributes=True))
+
+
+def dump_aggregates(rows) -> bytes:
+    """ JSON-тело ответа с агрегатами из строк БД """
+
+    return aggregates_adapter.dump_json(aggregates_adapter.validate_python(rows, from_attributes=True))
+
+
 class SpimexTradingResultQuery(BaseModel):
     """Схема запроса с валидацией дат"""
 
@@ -1,20 +1,298 @@
 import asyncio
+import hashlib
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-from app.database import AsyncSessionLocal
-from app.saver import download_spimex_report, find_latest_spimex_report
-from app.utils import parse_spimex_xlsx
+from datetime import date, timedelta
+
+from app.config import (
+    DISCOVERY_DAYS,
+    DOWNLOAD_WORKERS,
+    INGEST_CONFLICT_POLICY,
+    INGEST_PUBLISH_INTERVAL,
+    PARSE_MAX_IN_FLIGHT,
+    PARSE_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    SAVE_REPORTS_TO_DISK,
+)
+from app.database import AsyncSessionLocal, mark_primary_write
+from app.cache import bump_cache_version
+from app.partitions import ensure_partitions
+from app.repositories import (
+    add_trading_dates,
+    get_report_ledger,
+    refresh_daily_rollups,
+    upsert_report_ledger,
+    upsert_trading_results,
+)
+from app.saver import (
+    fetch_spimex_report,
+    find_latest_spimex_report,
+    report_date_from_url,
+    save_report_file,
+)
+from app.utils import parse_report_records
+from app.warmup import warm_cache
+
+parse_pool = None
+
+
+def get_parse_pool():
+    """ Пул процессов для парсинга Excel, создаётся при первом обращении """
+
+    global parse_pool
+    if parse_pool is None:
+        # spawn, а не fork: дочерние процессы не наследуют event loop и соединения с БД
+        parse_pool = ProcessPoolExecutor(
+            max_workers=PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return parse_pool
+
+
+def shutdown_parse_pool(pool=None):
+    """
+    Останавливает пул процессов парсинга, не блокируя event loop (процессы завершаются в фоне).
+    С pool — только если это всё ещё текущий пул: сломанный пул мог уже смениться новым
+    """
+
+    global parse_pool
+    if parse_pool is None or (pool is not None and pool is not parse_pool):
+        return
+    stopped, parse_pool = parse_pool, None
+    stopped.shutdown(wait=False, cancel_futures=True)
+
+
+async def parse_report(content, report_url):
+    """ Парсит содержимое отчёта в пуле процессов, не блокируя event loop """
+
+    loop = asyncio.get_running_loop()
+    pool = get_parse_pool()
+    try:
+        trading_date, records = await loop.run_in_executor(pool, parse_report_records, content, report_url)
+    except BrokenProcessPool as e:
+        # Упавший процесс ломает весь пул и все его задачи: пересоздаём пул при следующем обращении,
+        # но останавливаем только сломанный — другие задачи могли уже создать новый
+        print(f"Пул парсинга остановлен аварийно на файле {report_url}: {e}")
+        shutdown_parse_pool(pool)
+        return None
+    except Exception as e:
+        print(f"Ошибка при парсинге файла {report_url}: {e}")
+        return None
+
+    print(f"Файл {report_url} распарсен, дата торгов: {trading_date}, строк: {len(records)}")
+    return records
+
+
+def content_sha256(content):
+    """ SHA-256 содержимого отчёта """
+
+    return hashlib.sha256(content).hexdigest()
+
+
+async def ingest_report(db, report_url, records, content_hash, validators=None):
+    """ Сохраняет строки отчёта и запись журнала (с ETag и Last-Modified из validators) в одной транзакции """
+
+    validators = validators or {}
+    report_dates = {record["date"] for record in records}
+    try:
+        # Партиция месяца создаётся отдельной транзакцией до записи строк
+        await ensure_partitions(db, report_dates)
+
+        counts = await upsert_trading_results(db, records, INGEST_CONFLICT_POLICY)
+        counts["new_dates"] = await add_trading_dates(db, report_dates)
+        if counts["inserted"] or counts["updated"]:
+            await refresh_daily_rollups(db, report_dates)
+        await upsert_report_ledger(db, {
+            "report_date": report_date_from_url(report_url),
+            "url": report_url,
+            "etag": validators.get("etag"),
+            "last_modified": validators.get("last_modified"),
+            "content_hash": content_hash,
+            "row_count": len(records),
+        })
+        await db.commit()
+        print(f"Данные из {report_url} успешно сохранены в БД: {counts}")
+    except Exception as e:
+        print(f"Ошибка при сохранении данных в БД: {e}")
+        await db.rollback()
+        return None
+
+    return counts
+
+
+async def publish_ingest():
+    """ Данные в БД изменились: отметка о записи для чтения и новая версия данных кэша """
+
+    # Реплики получают новые строки с задержкой: пока чтение идёт с основной БД
+    await mark_primary_write()
+    # Новая версия данных: ответы, закэшированные до загрузки, больше не читаются
+    try:
+        await bump_cache_version()
+    except Exception as e:
+        print(f"Не удалось сменить версию данных кэша: {e}")
+
+
+async def download_worker(url_queue, parse_queue, ledger, stats, validators, missing):
+    """ Стадия скачивания: отчёты загружаются в память и передаются на парсинг """
+
+    while not url_queue.empty():
+        report_url = url_queue.get_nowait()
+        started = time.perf_counter()
+        content = await fetch_spimex_report(report_url, ledger.get(report_url), validators, missing)
+        stats["download_seconds"] += time.perf_counter() - started
+        if content is None:
+            continue
+
+        # Отчёты, содержимое которых совпадает с журналом, повторно не парсятся
+        content_hash = content_sha256(content)
+        if report_url in ledger and ledger[report_url].content_hash == content_hash:
+            print(f"Содержимое {report_url} не изменилось. Пропускаем.")
+            continue
+
+        if SAVE_REPORTS_TO_DISK:
+            await asyncio.to_thread(save_report_file, report_url, content)
+
+        # Если парсинг не успевает, скачивание ждёт здесь: очередь ограничивает память
+        await parse_queue.put((report_url, content, content_hash))
+
+
+async def parse_worker(parse_queue, write_queue, stats):
+    """ Стадия парсинга: содержимое отчёта разбирается в пуле процессов """
+
+    while (item := await parse_queue.get()) is not None:
+        report_url, content, content_hash = item
+        started = time.perf_counter()
+        records = await parse_report(content, report_url)
+        stats["parse_seconds"] += time.perf_counter() - started
+        if records is not None:
+            await write_queue.put((report_url, records, content_hash))
+
+
+async def write_worker(db, write_queue, stats, validators):
+    """
+    Стадия записи: отчёты сохраняются в БД по одному по мере готовности. Изменения публикуются
+    (publish_ingest) после первого записанного отчёта и затем не чаще раза в INGEST_PUBLISH_INTERVAL секунд,
+    последние — при завершении стадии, в том числе при ошибке
+    """
+
+    pending = False
+    published_at = float("-inf")
+    try:
+        while True:
+            # Пока есть неопубликованные изменения, новый отчёт ждём не дольше, чем до следующей публикации
+            timeout = max(0.0, published_at + INGEST_PUBLISH_INTERVAL - time.monotonic()) if pending else None
+            try:
+                item = await asyncio.wait_for(write_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = False
+
+            if item is None:
+                break
+            if item:
+                report_url, records, content_hash = item
+                started = time.perf_counter()
+                counts = await ingest_report(db, report_url, records, content_hash, validators.get(report_url))
+                stats["write_seconds"] += time.perf_counter() - started
+                if counts is not None:
+                    stats["files"] += 1
+                    stats["rows"] += len(records)
+                    for key, value in counts.items():
+                        stats[key] += value
+                    pending = pending or bool(counts.get("inserted") or counts.get("updated") or counts.get("new_dates"))
+
+            if pending and time.monotonic() - published_at >= INGEST_PUBLISH_INTERVAL:
+                await publish_ingest()
+                pending = False
+                published_at = time.monotonic()
+    finally:
+        # Отчёты, записанные до завершения или ошибки, уже зафиксированы в БД
+        if pending:
+            await publish_ingest()
+
+
+async def run_ingest_pipeline(
+        db, report_urls, ledger, download_workers=DOWNLOAD_WORKERS, validators=None, missing=None
+):
+    """
+    Конвейер скачивание -> парсинг -> запись. Стадии работают одновременно и связаны
+    ограниченными очередями, поэтому сеть, CPU и БД загружены параллельно,
+    а в памяти одновременно находится не больше PIPELINE_QUEUE_SIZE отчётов на стадию.
+
+    validators (url -> заголовки отчёта) и missing (URL отчётов, которых нет на сервере)
+    относятся только к этому запуску: их передаёт вызывающий, иначе создаются новые
+
+    Возвращает количество загруженных файлов и строк и суммарное время каждой стадии (сек)
+    """
+
+    stats = {
+        "files": 0, "rows": 0, "inserted": 0, "updated": 0, "skipped": 0, "new_dates": 0,
+        "download_seconds": 0.0, "parse_seconds": 0.0, "write_seconds": 0.0,
+    }
+    if not report_urls:
+        return stats
+    if validators is None:
+        validators = {}
+    if missing is None:
+        missing = set()
+
+    url_queue = asyncio.Queue()
+    for report_url in report_urls:
+        url_queue.put_nowait(report_url)
+    parse_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    write_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    downloaders = [
+        asyncio.create_task(download_worker(url_queue, parse_queue, ledger, stats, validators, missing))
+        for _ in range(min(download_workers, len(report_urls)))
+    ]
+    parsers = [
+        asyncio.create_task(parse_worker(parse_queue, write_queue, stats)) for _ in range(PARSE_MAX_IN_FLIGHT)
+    ]
+    writer = asyncio.create_task(write_worker(db, write_queue, stats, validators))
+
+    async def finish_downloads():
+        await asyncio.gather(*downloaders)
+        for _ in parsers:
+            await parse_queue.put(None)
+
+    async def finish_parsing():
+        await asyncio.gather(*parsers)
+        await write_queue.put(None)
+
+    try:
+        await asyncio.gather(finish_downloads(), finish_parsing(), writer)
+    finally:
+        # При ошибке в одной из стадий останавливаем остальные
+        for task in (*downloaders, *parsers, writer):
+            task.cancel()
+        # Запись при остановке публикует уже зафиксированные отчёты — дожидаемся её
+        await asyncio.gather(*downloaders, *parsers, writer, return_exceptions=True)
+
+    return stats
 
 
 async def fetch_and_parse_data(n: int):
-    """ Скачивает и парсит последние отчёты """
+    """ Скачивает и парсит последние отчёты, пропуская уже загруженные. Возвращает статистику загрузки """
 
     async with AsyncSessionLocal() as db:
-        files_to_download = await find_latest_spimex_report(n=n)
-
-        if files_to_download:
-            download_files = await asyncio.gather(*[download_spimex_report(url) for url in files_to_download])
-            for file in filter(None, download_files):
-                print(f"INSIDE FUNC: {parse_spimex_xlsx}")
-                print(f"Parsing file: {file}")
-                await parse_spimex_xlsx(file, db)
+        ledger = await get_report_ledger(db, since=date.today() - timedelta(days=DISCOVERY_DAYS))
+
+        # Заголовки, найденные при поиске, сохраняются в журнал вместе с отчётом
+        validators = {}
+        started = time.perf_counter()
+        files_to_download = await find_latest_spimex_report(n=n, ledger=ledger, validators=validators)
+        discovery_seconds = time.perf_counter() - started
+
+        stats = await run_ingest_pipeline(db, files_to_download or [], ledger, validators=validators)
+        stats["discovery_seconds"] = discovery_seconds
+        print(f"Загрузка завершена: {stats}")
         await db.commit()
+
+    # Данные изменились: самые частые ответы считаются заранее, до первых запросов
+    if stats["inserted"] or stats["updated"]:
+        stats["warmed_keys"] = await warm_cache()
+
+    return stats
@@ -1,29 +1,30 @@
+import io
 import re
 from datetime import datetime
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
 import pandas as pd
 
-from app.models import SpimexTradingResult
 
+REPORT_TABLE_MARKER = "Единица измерения: Метрическая тонна"
 
-async def check_existing_data(session, date, exchange_product_id):
-    """ Проверка, существует ли запись с такими датой и кодом инструмента """
 
-    query = select(SpimexTradingResult).filter_by(date=date, exchange_product_id=exchange_product_id)
-    result = await session.execute(query)
-    rows = result.scalars().all()
-    return rows
+def read_report_sheet(source, filename=None):
+    """
+    Читает лист отчёта целиком за одно открытие книги.
+    source — путь к файлу или содержимое файла (bytes), тогда формат определяется по filename
+    """
 
+    name = filename or source
+    engine = "openpyxl" if name.endswith(".xlsx") else "xlrd"
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    return pd.read_excel(source, engine=engine, header=None)
 
-def extract_trade_date(file_path):
-    """ Извлекает дату торгов из строки в DataFrame """
 
-    engine = "openpyxl" if file_path.endswith(".xlsx") else "xlrd"
-    df = pd.read_excel(file_path, engine=engine, header=None)
+def find_trade_date(raw_df):
+    """ Извлекает дату торгов из уже прочитанного листа """
 
     # Извлекаем дату из строки, содержащей "Дата торгов:"
-    header_row = df.iloc[3]  # 4-я строка, так как индексация начинается с 0
+    header_row = raw_df.iloc[3]  # 4-я строка, так как индексация начинается с 0
     header_text = ' '.join(header_row.astype(str))
 
     # Поиск даты по шаблону "Дата торгов: DD.MM.YYYY"
@@ -37,30 +38,58 @@ def extract_trade_date(file_path):
         raise ValueError("Дата торгов не найдена в заголовке файла")
 
 
-async def parse_spimex_xlsx(file_path, session: AsyncSession):
-    """ Парсит XLSX файл и сохраняет в БД """
+def find_table_start(raw_df):
+    """ Возвращает индекс строки "Единица измерения: Метрическая тонна" """
 
-    # Извлечение даты торгов из заголовка
-    trading_date = extract_trade_date(file_path)
+    # Строка находится в начале листа, поэтому идём по строкам и останавливаемся на первом совпадении
+    for index, row in enumerate(raw_df.itertuples(index=False)):
+        if any(isinstance(value, str) and REPORT_TABLE_MARKER in value for value in row):
+            return index
 
-    engine = "openpyxl" if file_path.endswith(".xlsx") else "xlrd"
-    df = pd.read_excel(file_path, engine=engine, header=None)
+    raise ValueError("Таблица 'Единица измерения: Метрическая тонна' не найдена в файле")
 
-    # Поиск строки "Единица измерения: Метрическая тонна"
-    target_row_index = None
-    for index, row in df.iterrows():
-        if row.astype(str).str.contains("Единица измерения: Метрическая тонна", na=False).any():
-            target_row_index = index
-            break
 
-    if target_row_index is None:
-        raise ValueError("Таблица 'Единица измерения: Метрическая тонна' не найдена в файле")
+def table_columns(header_row):
+    """ Названия столбцов из строки заголовков, как их построил бы pd.read_excel """
 
-    # Загрузка данных начиная со строки заголовков (следующей строки)
-    df = pd.read_excel(file_path, engine=engine, skiprows=target_row_index + 1)
+    columns = []
+    seen = {}
+    for position, value in enumerate(header_row):
+        name = f"Unnamed: {position}" if pd.isna(value) else str(value)
 
-    # Очистка названий столбцов
-    df.columns = df.columns.astype(str).str.replace("\n", " ").str.strip()
+        # Повторяющиеся названия нумеруются так же, как в pandas: "Имя", "Имя.1", ...
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+
+    return pd.Index(columns).str.replace("\n", " ").str.strip()
+
+
+def parse_spimex_report(source, filename=None):
+    """
+    Парсит отчёт за один проход: книга открывается один раз, из того же листа
+    извлекаются дата торгов, начало таблицы и сами данные
+    """
+
+    raw_df = read_report_sheet(source, filename)
+    trading_date = find_trade_date(raw_df)
+    target_row_index = find_table_start(raw_df)
+
+    # Данные начинаются со строки после заголовков (следующей за найденной строкой)
+    df = raw_df.iloc[target_row_index + 2:].reset_index(drop=True)
+    df.columns = table_columns(raw_df.iloc[target_row_index + 1])
+
+    return trading_date, build_trading_frame(df, trading_date)
+
+
+def build_trading_frame(df, trading_date):
+    """
+    Приводит таблицу отчёта к строкам spimex_trading_results.
+    Все преобразования выполняются над столбцами целиком, без обхода строк
+    """
 
     # Проверка существования ключевых столбцов
     required_columns = {
@@ -80,65 +109,39 @@ async def parse_spimex_xlsx(file_path, session: AsyncSession):
         """ Преобразует в числовой формат. """
         return pd.to_numeric(col, errors="coerce").fillna(0)
 
-    # Преобразование всех числовых данных в float, если возможно
-    df = df[df["Код Инструмента"] != "Итого:"]
-
-    df["Объем Договоров в единицах измерения"] = to_numeric_column(df["Объем Договоров в единицах измерения"])
-    df["Обьем Договоров, руб."] = to_numeric_column(df["Обьем Договоров, руб."])
-    df["Количество Договоров, шт."] = to_numeric_column(df["Количество Договоров, шт."])
-    df["Изменение рыночной цены к цене предыдуего дня"] = to_numeric_column(
-        df["Изменение рыночной цены к цене предыдуего дня"])
-
-    # Преобразование цены
-    df["Цена (за единицу измерения), руб."] = to_numeric_column(df["Цена (за единицу измерения), руб."])
-    df["Цена в Заявках (за единицу измерения)"] = to_numeric_column(df["Цена в Заявках (за единицу измерения)"])
-
-    # Преобразование столбца "Наименование Инструмента" в строковый тип
-    df["Наименование Инструмента"] = df["Наименование Инструмента"].astype(str)
-
-    # Фильтрация строк, где числовые столбцы имеют значения больше нуля
-    df = df[df["Объем Договоров в единицах измерения"] > 0]
-    df = df[df["Обьем Договоров, руб."] > 0]
-    df = df[df["Количество Договоров, шт."] > 0]
-
-    # Добавляем полей
-    df["oil_id"] = df["Код Инструмента"].astype(str).str[:4]
-    df["delivery_basis_id"] = df["Код Инструмента"].astype(str).str[4:7]
-    df["delivery_type_id"] = df["Код Инструмента"].astype(str).str[-1]
-    df["date"] = trading_date  # Используем извлеченную дату
-
-    # Логируем перед сохранением
-    print(f"Дата для записи: {trading_date}")
-
-    # Сохранение в БД
-    try:
-        for _, row in df.iterrows():
-            try:
-                # Проверяем, существуют ли уже записи в базе с такой датой и кодом инструмента
-                existing_rows = await check_existing_data(session, row["date"], row["Код Инструмента"])
-                if existing_rows:  # Если записи уже существуют, пропускаем
-                    print(f"Запись для {row['Код Инструмента']} на {row['date']} уже существует. Пропускаем.")
-                    continue  # Пропускаем эту запись
-
-                trading_result = SpimexTradingResult(
-                    exchange_product_id=row["Код Инструмента"],
-                    exchange_product_name=row["Наименование Инструмента"],
-                    oil_id=row["oil_id"],
-                    delivery_basis_id=row["delivery_basis_id"],
-                    delivery_basis_name=row["Базис поставки"],
-                    delivery_type_id=row["delivery_type_id"],
-                    volume=float(row["Объем Договоров в единицах измерения"]),
-                    total=float(row["Обьем Договоров, руб."]),
-                    count=int(row["Количество Договоров, шт."]),
-                    date=row["date"],  # Передаем дату
-                )
-                session.add(trading_result)
-            except Exception as e:
-                print(f"Ошибка при обработке строки {row['Код Инструмента']}: {e}")
-                continue
-
-        await session.commit()
-        print(f"Данные из {file_path} успешно сохранены в БД ")
-    except Exception as e:
-        print(f"Ошибка при сохранении данных в БД: {e}")
-        await session.rollback()
+    codes = df["Код Инструмента"].astype(str)
+    volume = to_numeric_column(df["Объем Договоров в единицах измерения"])
+    total = to_numeric_column(df["Обьем Договоров, руб."])
+    count = to_numeric_column(df["Количество Договоров, шт."])
+
+    # Одна маска вместо последовательных фильтраций: без итоговых строк и инструментов без сделок
+    mask = (codes != "Итого:") & (volume > 0) & (total > 0) & (count > 0)
+    codes = codes[mask]
+
+    return pd.DataFrame({
+        "exchange_product_id": codes,
+        "exchange_product_name": df["Наименование Инструмента"][mask].astype(str),
+        "oil_id": codes.str[:4],
+        "delivery_basis_id": codes.str[4:7],
+        "delivery_basis_name": df["Базис поставки"][mask],
+        "delivery_type_id": codes.str[-1],
+        "volume": volume[mask].astype("float64"),
+        "total": total[mask].astype("float64"),
+        "count": count[mask].astype("int64"),
+        "date": trading_date.date(),
+    }).reset_index(drop=True)
+
+
+def build_trading_records(df):
+    """ Список словарей для пакетного INSERT из подготовленной таблицы """
+
+    # tolist() отдаёт значения столбцов сразу в типах Python, это быстрее DataFrame.to_dict("records")
+    columns = list(df.columns)
+    return [dict(zip(columns, values)) for values in zip(*(df[column].tolist() for column in columns))]
+
+
+def parse_report_records(source, filename=None):
+    """ Парсит отчёт и возвращает дату торгов и строки для записи (выполняется в пуле процессов) """
+
+    trading_date, df = parse_spimex_report(source, filename)
+    return trading_date, build_trading_records(df)
@@ -0,0 +1,114 @@
+"""
+Прогрев кэша после загрузки.
+
+Загрузка меняет версию данных кэша, и без прогрева первые запросы после неё идут в БД.
+Сразу после загрузки заранее считаются самые частые ключи:
+- первые страницы get_trading_results без фильтров (CACHE_WARMUP_LIMITS строк)
+- все торговые дни для get_last_trading_dates (один ключ на любой count)
+- get_dynamics без фильтров за последние CACHE_WARMUP_DYNAMICS_DAYS дней
+- CACHE_WARMUP_TOP_HITS самых частых запросов из счётчика обращений
+"""
+from datetime import date, timedelta
+
+from app.cache import (
+    TRADING_DATES_CACHE_KEY,
+    flush_hits,
+    get_many_cached_data,
+    get_top_hits,
+    set_many_cached_data,
+)
+from app.config import CACHE_WARMUP, CACHE_WARMUP_DYNAMICS_DAYS, CACHE_WARMUP_LIMITS, CACHE_WARMUP_TOP_HITS
+from app.database import AsyncSessionLocal
+from app.pages import (
+    dynamics_cache_key,
+    load_dynamics_page,
+    load_trading_dates,
+    load_trading_results_page,
+    trading_results_cache_key,
+)
+
+NO_FILTERS = {"oil_id": None, "delivery_type_id": None, "delivery_basis_id": None}
+
+
+def default_specs(today: date) -> list[tuple[str, dict]]:
+    """ Заданные настройками запросы для прогрева: (эндпоинт, параметры) """
+
+    specs = [("get_last_trading_dates", {})]
+    specs += [
+        ("get_trading_results", {"filters": NO_FILTERS, "limit": limit, "offset": 0})
+        for limit in CACHE_WARMUP_LIMITS
+    ]
+    specs += [
+        ("get_dynamics", {
+            "start_date": (today - timedelta(days=days)).isoformat(), "end_date": today.isoformat(),
+            "filters": NO_FILTERS, "limit": 10, "offset": 0,
+        })
+        for days in CACHE_WARMUP_DYNAMICS_DAYS
+    ]
+    return specs
+
+
+def cache_entry(db, endpoint: str, params: dict):
+    """ Ключ кэша запроса и функция, которая считает его значение """
+
+    if endpoint == "get_last_trading_dates":
+        return TRADING_DATES_CACHE_KEY, lambda: load_trading_dates(db)
+
+    filters, limit, offset = params["filters"], params["limit"], params["offset"]
+    if endpoint == "get_trading_results":
+        return (
+            trading_results_cache_key(filters, limit, offset, None),
+            lambda: load_trading_results_page(db, filters, limit, offset),
+        )
+    if endpoint == "get_dynamics":
+        start_date, end_date = date.fromisoformat(params["start_date"]), date.fromisoformat(params["end_date"])
+        return (
+            dynamics_cache_key(start_date, end_date, filters, limit, offset, None),
+            lambda: load_dynamics_page(db, start_date, end_date, filters, limit, offset),
+        )
+    raise ValueError(f"Неизвестный эндпоинт для прогрева: {endpoint}")
+
+
+async def warm_cache() -> int:
+    """
+    Прогрев кэша после загрузки: наличие всех ключей проверяется одним MGET,
+    отсутствующие считаются и сохраняются одним конвейером. Блокировки ключей (single_flight) прогрев не берёт:
+    значения попадают в Redis только в конце, и ждущие блокировку воркеры всё равно считали бы их сами.
+    Возвращает количество посчитанных ключей
+    """
+
+    if not CACHE_WARMUP:
+        return 0
+
+    specs = default_specs(date.today())
+    if CACHE_WARMUP_TOP_HITS > 0:
+        try:
+            await flush_hits()
+            specs += await get_top_hits(CACHE_WARMUP_TOP_HITS)
+        except Exception as e:
+            print(f"Не удалось получить частые запросы для прогрева: {e}")
+
+    computed = {}
+    # Сразу после загрузки реплики могут отставать, поэтому прогрев читает основную БД
+    async with AsyncSessionLocal() as db:
+        entries = {}
+        for endpoint, params in specs:
+            try:
+                key, load = cache_entry(db, endpoint, params)
+                entries.setdefault(key, load)
+            except Exception as e:
+                print(f"Неверный запрос для прогрева кэша {endpoint} {params}: {e}")
+
+        cached = await get_many_cached_data(list(entries))
+        for (key, load), value in zip(entries.items(), cached):
+            if value is not None:
+                continue
+            try:
+                computed[key] = await load()
+            except Exception as e:
+                print(f"Ошибка прогрева кэша для ключа {key}: {e}")
+                await db.rollback()
+
+    await set_many_cached_data(computed)
+    print(f"Прогрев кэша: посчитано ключей {len(computed)} из {len(entries)}")
+    return len(computed)
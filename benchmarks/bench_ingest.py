@@ -0,0 +1,84 @@
+"""
+Сквозной бенчмарк загрузки: fetch_and_parse_data против локального стенда SPIMEX
+и локального Postgres (настройки БД берутся из .env).
+
+    python -m benchmarks.bench_ingest --files 10 --rows 300 --latency 0.05 --reset
+
+Выводит время поиска, скачивания, парсинга и записи в БД и пиковый RSS.
+Время стадий — суммарное по всем воркерам стадии, поэтому при параллельной
+работе оно может превышать общее время.
+--reset очищает spimex_trading_results, spimex_report_ledger, spimex_trading_dates
+и spimex_daily_rollups перед запуском.
+"""
+import argparse
+import asyncio
+import os
+import resource
+import time
+
+from benchmarks.spimex_stand import stand_base_url, start_stand
+
+
+def peak_rss_mb(who):
+    """ Пиковый RSS в МБ (ru_maxrss в Linux — в КБ) """
+
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+async def run(args):
+    # Настройки приложения читаются при импорте, поэтому адрес стенда задаётся до импорта app
+    os.environ["SPIMEX_BASE_URL"] = stand_base_url(args.port)
+    os.environ["DISCOVERY_DAYS"] = str(args.days)
+
+    from sqlalchemy import text
+
+    from app.database import AsyncSessionLocal, create_db
+    from app.saver import close_http_session
+    from app.services import fetch_and_parse_data, shutdown_parse_pool
+
+    runner = await start_stand(args.port, args.days, args.rows, args.latency)
+    try:
+        await create_db()
+        if args.reset:
+            async with AsyncSessionLocal() as db:
+                await db.execute(text(
+                    "TRUNCATE spimex_trading_results, spimex_report_ledger, spimex_trading_dates, spimex_daily_rollups "
+                    "RESTART IDENTITY"
+                ))
+                await db.commit()
+
+        started = time.perf_counter()
+        stats = await fetch_and_parse_data(args.files)
+        wall = time.perf_counter() - started
+    finally:
+        await close_http_session()
+        shutdown_parse_pool()
+        await runner.cleanup()
+
+    print()
+    print(f"Файлов: {stats['files']}, строк: {stats['rows']} "
+          f"(вставлено {stats['inserted']}, обновлено {stats['updated']}, пропущено {stats['skipped']})")
+    print(f"Поиск отчётов:      {stats['discovery_seconds']:8.3f} с")
+    print(f"Скачивание (сумма): {stats['download_seconds']:8.3f} с")
+    print(f"Парсинг (сумма):    {stats['parse_seconds']:8.3f} с")
+    print(f"Запись в БД:        {stats['write_seconds']:8.3f} с")
+    print(f"Всего:              {wall:8.3f} с")
+    print(f"Пиковый RSS: процесс {peak_rss_mb(resource.RUSAGE_SELF):.1f} МБ, "
+          f"процесс парсинга (макс.) {peak_rss_mb(resource.RUSAGE_CHILDREN):.1f} МБ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10, help="Сколько последних отчётов загрузить")
+    parser.add_argument("--rows", type=int, default=300, help="Строк в отчёте")
+    parser.add_argument("--latency", type=float, default=0.05, help="Задержка ответа стенда, сек")
+    parser.add_argument("--days", type=int, default=30, help="Глубина истории на стенде и при поиске, дней")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--reset", action="store_true", help="Очистить таблицы перед запуском")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
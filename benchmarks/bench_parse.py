@@ -0,0 +1,82 @@
+"""
+Бенчмарк парсинга отчётов: прежний путь (три вызова pd.read_excel на файл)
+против однопроходного parse_spimex_report.
+
+    python -m benchmarks.bench_parse                      # 10 синтетических отчётов по 300 строк
+    python -m benchmarks.bench_parse --dir spimex_reports  # настоящие отчёты из каталога
+"""
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from app.utils import REPORT_TABLE_MARKER, parse_spimex_report
+from benchmarks.sample_reports import write_sample_reports
+
+
+def legacy_parse(file_path):
+    """ Чтение отчёта так, как это делалось до однопроходного парсера """
+
+    engine = "openpyxl" if file_path.endswith(".xlsx") else "xlrd"
+
+    # 1-е чтение: дата торгов
+    pd.read_excel(file_path, engine=engine, header=None)
+
+    # 2-е чтение: поиск начала таблицы
+    df = pd.read_excel(file_path, engine=engine, header=None)
+    target_row_index = None
+    for index, row in df.iterrows():
+        if row.astype(str).str.contains(REPORT_TABLE_MARKER, na=False).any():
+            target_row_index = index
+            break
+
+    # 3-е чтение: сама таблица
+    df = pd.read_excel(file_path, engine=engine, skiprows=target_row_index + 1)
+    df.columns = df.columns.astype(str).str.replace("\n", " ").str.strip()
+    return df
+
+
+def measure(func, paths, repeat):
+    """ Лучшее среднее время на файл (мс) из repeat прогонов """
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            func(path)
+        per_file = (time.perf_counter() - start) / len(paths) * 1000
+        best = per_file if best is None else min(best, per_file)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", help="Каталог с отчётами oil_xls_*.xls")
+    parser.add_argument("--files", type=int, default=10, help="Количество синтетических отчётов")
+    parser.add_argument("--rows", type=int, default=300, help="Строк в синтетическом отчёте")
+    parser.add_argument("--repeat", type=int, default=3, help="Количество прогонов")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.dir:
+            paths = sorted(glob.glob(os.path.join(args.dir, "*.xls*")))
+        else:
+            paths = write_sample_reports(tmp, args.files, args.rows)
+
+        if not paths:
+            raise SystemExit("Отчёты не найдены")
+
+        before = measure(legacy_parse, paths, args.repeat)
+        after = measure(parse_spimex_report, paths, args.repeat)
+
+    print(f"Файлов: {len(paths)}")
+    print(f"До (3 x read_excel):  {before:8.2f} мс/файл")
+    print(f"После (один проход):  {after:8.2f} мс/файл")
+    print(f"Ускорение:            {before / after:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Бенчмарк запросов API к spimex_trading_results на большой таблице
+(локальный Postgres, настройки БД берутся из .env).
+
+    python -m benchmarks.bench_queries --days 2500 --products 400 --seed
+    python -m benchmarks.bench_queries --without-indexes
+
+--seed заполняет таблицу синтетическими данными (days * products строк, прежние данные удаляются).
+Для каждого запроса выводится лучшее и медианное время и план EXPLAIN (ANALYZE, BUFFERS).
+Затем сравнивается глубокая пагинация: offset против курсора на той же глубине.
+--without-indexes повторяет замер без составных индексов: они удаляются внутри
+транзакции, которая затем откатывается, поэтому схема не меняется.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import Date, cast, func, literal_column, select, text
+from sqlalchemy.dialects import postgresql
+
+from app.models import SpimexTradingResult
+from app.partitions import ensure_partitions
+from app.repositories import (
+    build_aggregates_query,
+    build_dynamics_query,
+    build_trading_results_query,
+    encode_cursor,
+    refresh_daily_rollups,
+)
+
+SEED_SQL = """
+    INSERT INTO spimex_trading_results (
+        exchange_product_id, exchange_product_name, oil_id, delivery_basis_id, delivery_basis_name,
+        delivery_type_id, volume, total, count, date, created_at, updated_at
+    )
+    SELECT
+        p.oil_id || p.basis_id || 'A' || p.type_id,
+        'Продукт ' || p.n,
+        p.oil_id, p.basis_id, 'Базис ' || p.basis_id, p.type_id,
+        (random() * 1000)::int + 1,
+        (random() * 1000000)::int + 1,
+        (random() * 10)::int + 1,
+        CAST(:last_day AS date) - d.i, now(), now()
+    FROM generate_series(0, :days - 1) AS d(i)
+    CROSS JOIN (
+        SELECT
+            n,
+            'A' || lpad((n % 100)::text, 3, '0') AS oil_id,
+            'B' || lpad((n / 100 % 100)::text, 2, '0') AS basis_id,
+            chr(65 + n % 3) AS type_id
+        FROM generate_series(0, :products - 1) AS n
+    ) AS p
+"""
+
+
+def raw_aggregates_query(start_date, end_date):
+    """ Те же агрегаты по месяцам и oil_id, но напрямую по spimex_trading_results — для сравнения """
+
+    results = SpimexTradingResult
+    bucket_start = cast(func.date_trunc(literal_column("'month'"), results.date), Date)
+    return select(
+        bucket_start, results.oil_id, func.sum(results.volume), func.sum(results.total), func.sum(results.count),
+        func.sum(results.total) / func.nullif(func.sum(results.volume), 0),
+    ).where(
+        results.date >= start_date, results.date <= end_date,
+    ).group_by(bucket_start, results.oil_id).order_by(bucket_start, results.oil_id)
+
+
+# (название, запрос) — те же фильтры, что приходят в эндпоинты
+SCENARIOS = [
+    ("trading_results без фильтров", lambda last_day: build_trading_results_query(
+        {"oil_id": None, "delivery_type_id": None, "delivery_basis_id": None}, 100, 0)),
+    ("trading_results oil_id", lambda last_day: build_trading_results_query(
+        {"oil_id": "A042", "delivery_type_id": None, "delivery_basis_id": None}, 100, 0)),
+    ("trading_results delivery_basis_id", lambda last_day: build_trading_results_query(
+        {"oil_id": None, "delivery_type_id": None, "delivery_basis_id": "B01"}, 100, 0)),
+    ("trading_results все фильтры", lambda last_day: build_trading_results_query(
+        {"oil_id": "A042", "delivery_type_id": "A", "delivery_basis_id": "B01"}, 100, 0)),
+    ("dynamics 30 дней", lambda last_day: build_dynamics_query(
+        last_day - timedelta(days=30), last_day,
+        {"oil_id": None, "delivery_type_id": None, "delivery_basis_id": None}, 100, 0)),
+    ("dynamics 365 дней oil_id", lambda last_day: build_dynamics_query(
+        last_day - timedelta(days=365), last_day,
+        {"oil_id": "A042", "delivery_type_id": None, "delivery_basis_id": None}, 100, 0)),
+    ("dynamics 365 дней все фильтры", lambda last_day: build_dynamics_query(
+        last_day - timedelta(days=365), last_day,
+        {"oil_id": "A042", "delivery_type_id": "A", "delivery_basis_id": "B01"}, 100, 0)),
+    ("aggregates 365 дней по месяцам", lambda last_day: build_aggregates_query(
+        "oil_id", "month", last_day - timedelta(days=365), last_day)),
+    ("aggregates 365 дней без дневных сумм", lambda last_day: raw_aggregates_query(
+        last_day - timedelta(days=365), last_day)),
+]
+
+
+def compile_query(query):
+    """ SQL с подставленными параметрами — для EXPLAIN """
+
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+async def seed(conn, days, products):
+    print(f"Заполнение таблицы: {days} дней x {products} инструментов = {days * products} строк")
+    started = time.perf_counter()
+    # Заполнение миллионов строк идёт дольше statement_timeout запросов API
+    await conn.execute(text("SET LOCAL statement_timeout = 0"))
+    await conn.execute(text("TRUNCATE spimex_trading_results RESTART IDENTITY"))
+    await conn.execute(text(SEED_SQL), {"last_day": date.today(), "days": days, "products": products})
+    await refresh_daily_rollups(conn)
+    await conn.execute(text("ANALYZE spimex_trading_results"))
+    await conn.execute(text("ANALYZE spimex_daily_rollups"))
+    print(f"Заполнено за {time.perf_counter() - started:.1f} с")
+
+
+async def measure(conn, sql, repeat):
+    """ Время выполнения запроса в мс (лучшее, медиана) """
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await conn.execute(text(sql))
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings), statistics.median(timings)
+
+
+async def run_scenarios(conn, repeat, plans):
+    last_day = (await conn.execute(text("SELECT max(date) FROM spimex_trading_results"))).scalar()
+    if last_day is None:
+        raise SystemExit("Таблица пуста, запустите с --seed")
+
+    for name, build in SCENARIOS:
+        sql = compile_query(build(last_day))
+        best, median = await measure(conn, sql, repeat)
+        print(f"{name:35} лучшее {best:9.2f} мс, медиана {median:9.2f} мс")
+
+        if plans:
+            plan = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"))
+            for (line,) in plan:
+                print(f"    {line}")
+            print()
+
+
+async def run_deep_pages(conn, repeat, depths):
+    """ Время страницы на глубине depth: offset против курсора """
+
+    filters = {"oil_id": None, "delivery_type_id": None, "delivery_basis_id": None}
+    print("Глубокая пагинация (100 строк на странице):")
+
+    for depth in depths:
+        key = (await conn.execute(text(compile_query(
+            build_trading_results_query(filters, 1, depth - 1).with_only_columns(
+                SpimexTradingResult.date, SpimexTradingResult.id)
+        )))).first()
+        if key is None:
+            break
+
+        offset_best, _ = await measure(conn, compile_query(build_trading_results_query(filters, 100, depth)), repeat)
+        cursor = encode_cursor(*key)
+        cursor_best, _ = await measure(
+            conn, compile_query(build_trading_results_query(filters, 100, 0, cursor)), repeat
+        )
+        print(f"    глубина {depth:>9}: offset {offset_best:9.2f} мс, курсор {cursor_best:9.2f} мс")
+    print()
+
+
+async def run(args):
+    from app.database import AsyncSessionLocal, create_db, engine
+
+    await create_db()
+
+    if args.seed:
+        # Партиции месяцев создаются до заполнения, иначе все строки лягут в партицию по умолчанию
+        async with AsyncSessionLocal() as db:
+            await ensure_partitions(db, [date.today() - timedelta(days=i) for i in range(args.days)])
+        async with engine.begin() as conn:
+            await seed(conn, args.days, args.products)
+
+    async with engine.connect() as conn:
+        count = (await conn.execute(text("SELECT count(*) FROM spimex_trading_results"))).scalar()
+        print(f"Строк в таблице: {count}\n")
+
+        transaction = await conn.begin()
+        try:
+            # Без индексов и на глубоких страницах offset запросы могут идти дольше statement_timeout
+            await conn.execute(text("SET LOCAL statement_timeout = 0"))
+            if args.without_indexes:
+                for index in SpimexTradingResult.__table__.indexes:
+                    await conn.execute(text(f"DROP INDEX {index.name}"))
+                print("Составные индексы удалены (до отката транзакции)\n")
+
+            await run_scenarios(conn, args.repeat, not args.no_plans)
+            await run_deep_pages(conn, args.repeat, args.depths)
+        finally:
+            await transaction.rollback()
+
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="Заполнить таблицу синтетическими данными")
+    parser.add_argument("--days", type=int, default=2500, help="Дней истории при заполнении")
+    parser.add_argument("--products", type=int, default=400, help="Инструментов в день при заполнении")
+    parser.add_argument("--repeat", type=int, default=5, help="Прогонов каждого запроса")
+    parser.add_argument("--without-indexes", action="store_true", help="Замер без составных индексов")
+    parser.add_argument("--no-plans", action="store_true", help="Не выводить планы EXPLAIN")
+    parser.add_argument(
+        "--depths", type=int, nargs="+", default=[100, 10_000, 100_000, 500_000],
+        help="Глубины страниц для сравнения offset и курсора",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Микробенчмарк сериализации страницы списка торгов (без БД):
+прежний путь (ORM-объекты, model_validate на каждую строку, model_dump для кэша,
+повторная проверка по response_model и json.dumps в FastAPI) против
+строк с нужными столбцами и одного вызова TypeAdapter.
+
+    python -m benchmarks.bench_serialization --rows 100
+"""
+import argparse
+import json
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from app.models import SpimexTradingResult
+from app.repositories import RESPONSE_COLUMNS
+from app.schemas import SpimexTradingResultResponse, dump_trading_results, trading_results_adapter
+
+# Строка результата Core-запроса с атрибутами по столбцам RESPONSE_COLUMNS
+Row = namedtuple("Row", [column.key for column in RESPONSE_COLUMNS])
+
+
+def sample_values(rows):
+    """ Значения столбцов ответа для rows строк """
+
+    start = date(2025, 4, 3)
+    return [
+        {
+            "id": i + 1,
+            "exchange_product_id": f"A{i % 1000:03d}UFM060F",
+            "exchange_product_name": "Бензин (АИ-92-К5)",
+            "oil_id": f"A{i % 1000:03d}",
+            "delivery_basis_id": "UFM",
+            "delivery_basis_name": "ст. Уфа",
+            "delivery_type_id": "F",
+            "volume": 60.0 * (i + 1),
+            "total": 3_600_000.0 * (i + 1),
+            "count": i % 10 + 1,
+            "date": start - timedelta(days=i // 50),
+        }
+        for i in range(rows)
+    ]
+
+
+def date_converter(obj):
+    """ Как в set_cached_data """
+
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError
+
+
+def legacy_serialize(entities):
+    """ Путь до проекции: так данные проходили через эндпоинт """
+
+    data_pydantic = [SpimexTradingResultResponse.model_validate(item) for item in entities]
+    cache_payload = json.dumps([item.model_dump() for item in data_pydantic], default=date_converter)
+
+    # Ответ: проверка по response_model и кодирование в JSONResponse
+    content = jsonable_encoder(trading_results_adapter.validate_python(data_pydantic, from_attributes=True))
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+    return body, cache_payload
+
+
+def projected_serialize(rows):
+    """ Текущий путь: строки Core и один TypeAdapter на весь список """
+
+    cache_payload = json.dumps([row._asdict() for row in rows], default=date_converter)
+    return dump_trading_results(rows), cache_payload
+
+
+def measure(func, items, repeat):
+    """ Лучшее время прогона (мс) и результат """
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(items)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100, help="Строк на странице")
+    parser.add_argument("--repeat", type=int, default=200, help="Количество прогонов")
+    args = parser.parse_args()
+
+    values = sample_values(args.rows)
+    entities = [SpimexTradingResult(**item, created_at=datetime.now(), updated_at=datetime.now()) for item in values]
+    rows = [Row(**item) for item in values]
+
+    before, (legacy_body, _) = measure(legacy_serialize, entities, args.repeat)
+    after, (body, _) = measure(projected_serialize, rows, args.repeat)
+
+    if json.loads(legacy_body) != json.loads(body):
+        raise SystemExit("Тела ответов расходятся")
+
+    per_100 = 100 / args.rows
+    print(f"Строк на странице: {args.rows}")
+    print(f"До (ORM + model_validate):       {before:8.3f} мс ({before * per_100:.3f} мс на 100 строк)")
+    print(f"После (проекция + TypeAdapter):  {after:8.3f} мс ({after * per_100:.3f} мс на 100 строк)")
+    print(f"Ускорение:                       {before / after:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
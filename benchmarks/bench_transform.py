@@ -0,0 +1,104 @@
+"""
+Микробенчмарк преобразования таблицы отчёта в строки для INSERT:
+прежний путь (последовательные фильтры + iterrows с float()/int() на каждую строку)
+против build_trading_frame + build_trading_records.
+
+    python -m benchmarks.bench_transform --rows 10000
+"""
+import argparse
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from app.utils import build_trading_frame, build_trading_records, find_table_start, table_columns
+from benchmarks.sample_reports import build_report_rows
+
+
+def synthetic_table(rows):
+    """ Таблица отчёта в том виде, в каком её получает парсер после чтения листа """
+
+    raw_df = pd.DataFrame(build_report_rows(datetime(2025, 4, 3), rows))
+    target_row_index = find_table_start(raw_df)
+    df = raw_df.iloc[target_row_index + 2:].reset_index(drop=True)
+    df.columns = table_columns(raw_df.iloc[target_row_index + 1])
+    return df
+
+
+def legacy_transform(df, trading_date):
+    """ Преобразование так, как оно делалось до векторизации """
+
+    def to_numeric_column(col):
+        return pd.to_numeric(col, errors="coerce").fillna(0)
+
+    df = df[df["Код Инструмента"] != "Итого:"].copy()
+    df["Объем Договоров в единицах измерения"] = to_numeric_column(df["Объем Договоров в единицах измерения"])
+    df["Обьем Договоров, руб."] = to_numeric_column(df["Обьем Договоров, руб."])
+    df["Количество Договоров, шт."] = to_numeric_column(df["Количество Договоров, шт."])
+    df["Наименование Инструмента"] = df["Наименование Инструмента"].astype(str)
+
+    df = df[df["Объем Договоров в единицах измерения"] > 0]
+    df = df[df["Обьем Договоров, руб."] > 0]
+    df = df[df["Количество Договоров, шт."] > 0].copy()
+
+    df["oil_id"] = df["Код Инструмента"].astype(str).str[:4]
+    df["delivery_basis_id"] = df["Код Инструмента"].astype(str).str[4:7]
+    df["delivery_type_id"] = df["Код Инструмента"].astype(str).str[-1]
+    df["date"] = trading_date
+
+    records = []
+    for _, row in df.iterrows():
+        records.append({
+            "exchange_product_id": row["Код Инструмента"],
+            "exchange_product_name": row["Наименование Инструмента"],
+            "oil_id": row["oil_id"],
+            "delivery_basis_id": row["delivery_basis_id"],
+            "delivery_basis_name": row["Базис поставки"],
+            "delivery_type_id": row["delivery_type_id"],
+            "volume": float(row["Объем Договоров в единицах измерения"]),
+            "total": float(row["Обьем Договоров, руб."]),
+            "count": int(row["Количество Договоров, шт."]),
+            "date": row["date"].date(),
+        })
+    return records
+
+
+def vectorized_transform(df, trading_date):
+    return build_trading_records(build_trading_frame(df, trading_date))
+
+
+def measure(func, df, trading_date, repeat):
+    """ Лучшее время прогона (мс) и результат """
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df, trading_date)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000, help="Строк в синтетическом отчёте")
+    parser.add_argument("--repeat", type=int, default=5, help="Количество прогонов")
+    args = parser.parse_args()
+
+    df = synthetic_table(args.rows)
+    trading_date = datetime(2025, 4, 3)
+
+    before, legacy_records = measure(legacy_transform, df, trading_date, args.repeat)
+    after, records = measure(vectorized_transform, df, trading_date, args.repeat)
+
+    if legacy_records != records:
+        raise SystemExit("Результаты преобразований расходятся")
+
+    print(f"Строк в таблице: {len(df)}, к записи: {len(records)}")
+    print(f"До (iterrows):        {before:8.2f} мс")
+    print(f"После (по столбцам):  {after:8.2f} мс")
+    print(f"Ускорение:            {before / after:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
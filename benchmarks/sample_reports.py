@@ -0,0 +1,122 @@
+"""
+Генератор синтетических отчётов SPIMEX (oil_xls_*.xls) для бенчмарков.
+
+Структура листа повторяет настоящий бюллетень: дата торгов в 4-й строке,
+строка "Единица измерения: Метрическая тонна", двухуровневая шапка таблицы,
+строки инструментов и итоговые строки "Итого:".
+
+Для записи .xls нужен пакет xlwt: pip install xlwt
+"""
+import io
+import os
+import random
+from datetime import date, timedelta
+
+HEADER = [
+    "",
+    "Код\nИнструмента",
+    "Наименование\nИнструмента",
+    "Базис\nпоставки",
+    "Объем\nДоговоров\nв единицах\nизмерения",
+    "Обьем\nДоговоров,\nруб.",
+    "Изменение рыночной\nцены к цене\nпредыдуего дня",
+    "Цена (за единицу\nизмерения), руб.",
+    "",
+    "",
+    "Цена в Заявках (за единицу\nизмерения)",
+    "",
+    "Количество\nДоговоров,\nшт.",
+]
+
+SUB_HEADER = ["", "", "", "", "", "", "", "Минимальная", "Средневзвешенная", "Максимальная",
+              "Лучшее\nпредложение", "Лучший\nспрос", ""]
+
+OILS = ["A592", "A100", "DT5R", "DTZ5", "M100", "TS1A", "PBT0", "SUG0"]
+BASES = [("UFM", "ст. Уфа"), ("NVY", "ст. Новоярославская"), ("KRS", "ст. Кириши"),
+         ("ANK", "ст. Ангарск"), ("OMS", "ст. Омск"), ("VLG", "ст. Волгоград")]
+
+
+def _xlwt():
+    try:
+        import xlwt
+    except ImportError:
+        raise SystemExit("Для генерации отчётов установите xlwt: pip install xlwt")
+    return xlwt
+
+
+def build_report_rows(trade_date: date, rows: int, seed: int = 0):
+    """ Строит строки листа отчёта (список списков значений) """
+
+    rnd = random.Random(seed)
+    sheet = [
+        [],
+        ["", "Бюллетень по итогам торгов в Секции «Нефтепродукты»"],
+        [],
+        ["", f"Дата торгов: {trade_date.strftime('%d.%m.%Y')}"],
+        [],
+        ["", "Секция Биржи: «Нефтепродукты» АО «СПбМТСБ»"],
+        ["", "Единица измерения: Метрическая тонна"],
+        HEADER,
+        SUB_HEADER,
+    ]
+
+    for i in range(rows):
+        oil = OILS[i % len(OILS)]
+        basis_id, basis_name = BASES[(i // len(OILS)) % len(BASES)]
+        code = f"{oil}{basis_id}{i % 1000:03d}{'FJ'[i % 2]}"
+
+        if rnd.random() < 0.3:
+            # Инструмент без сделок: в числовых столбцах прочерки
+            sheet.append(["", code, f"{oil} {basis_name}", basis_name, "-", "-", "-", "-", "-", "-",
+                          "-", "-", "-"])
+            continue
+
+        count = rnd.randint(1, 50)
+        volume = count * 60
+        price = rnd.randint(40_000, 80_000)
+        sheet.append([
+            "", code, f"{oil} {basis_name}", basis_name, volume, volume * price,
+            rnd.randint(-500, 500), price - 100, price, price + 100, price + 50, price - 50, count,
+        ])
+
+    sheet.append(["", "Итого:", "", "", "", "", "", "", "", "", "", "", rows])
+    sheet.append([])
+    sheet.append(["", "Итого:", "", "", "", "", "", "", "", "", "", "", rows])
+    return sheet
+
+
+def build_report_bytes(trade_date: date, rows: int = 300, seed: int = 0) -> bytes:
+    """ Генерирует .xls отчёт за указанную дату и возвращает его содержимое """
+
+    xlwt = _xlwt()
+    workbook = xlwt.Workbook(encoding="utf-8")
+    worksheet = workbook.add_sheet("TRADE_SUMMARY")
+
+    for row_index, row in enumerate(build_report_rows(trade_date, rows, seed)):
+        for col_index, value in enumerate(row):
+            if value != "":
+                worksheet.write(row_index, col_index, value)
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def report_filename(trade_date: date) -> str:
+    """ Имя файла в формате SPIMEX """
+
+    return f"oil_xls_{trade_date.strftime('%Y%m%d')}162000.xls"
+
+
+def write_sample_reports(directory: str, count: int, rows: int = 300, start: date = date(2025, 4, 3)):
+    """ Сохраняет count отчётов за последовательные дни и возвращает пути к ним """
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        trade_date = start - timedelta(days=i)
+        path = os.path.join(directory, report_filename(trade_date))
+        with open(path, "wb") as file:
+            file.write(build_report_bytes(trade_date, rows, seed=i))
+        paths.append(path)
+    return paths
@@ -0,0 +1,81 @@
+"""
+Локальная замена spimex.com для бенчмарков: отдаёт сгенерированные отчёты oil_xls_*.xls.
+
+    python -m benchmarks.spimex_stand --port 8765 --rows 300 --latency 0.05
+
+Отчёты есть только за рабочие дни (как на бирже) и генерируются заранее,
+чтобы время генерации не попадало в замеры. Поддерживаются HEAD, ETag и If-None-Match.
+"""
+import argparse
+import asyncio
+import hashlib
+from datetime import date, timedelta
+
+from aiohttp import web
+
+from benchmarks.sample_reports import build_report_bytes
+
+REPORT_PATH = "/upload/reports/oil_xls/oil_xls_{date:\\d{8}}162000.xls"
+
+
+def trading_days(days, today=None):
+    """ Рабочие дни за последние days дней """
+
+    today = today or date.today()
+    return [today - timedelta(days=i) for i in range(days) if (today - timedelta(days=i)).weekday() < 5]
+
+
+def build_stand(days=30, rows=300, latency=0.0):
+    """ aiohttp-приложение с отчётами за рабочие дни последних days дней """
+
+    reports = {}
+    for i, trade_date in enumerate(trading_days(days)):
+        body = build_report_bytes(trade_date, rows, seed=i)
+        reports[trade_date.strftime("%Y%m%d")] = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+
+    async def report(request):
+        await asyncio.sleep(latency)
+
+        found = reports.get(request.match_info["date"])
+        if found is None:
+            raise web.HTTPNotFound()
+
+        body, etag = found
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, headers={"ETag": etag}, content_type="application/vnd.ms-excel")
+
+    app = web.Application()
+    app.router.add_get(REPORT_PATH, report)  # HEAD обрабатывается тем же обработчиком
+    return app
+
+
+async def start_stand(port=8765, days=30, rows=300, latency=0.0):
+    """ Запускает стенд в текущем event loop и возвращает runner для остановки """
+
+    runner = web.AppRunner(build_stand(days, rows, latency))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+def stand_base_url(port):
+    """ Значение SPIMEX_BASE_URL для стенда """
+
+    return f"http://127.0.0.1:{port}/upload/reports/oil_xls/oil_xls_"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--days", type=int, default=30, help="Глубина истории в днях")
+    parser.add_argument("--rows", type=int, default=300, help="Строк в отчёте")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, сек")
+    args = parser.parse_args()
+
+    print(f"SPIMEX_BASE_URL={stand_base_url(args.port)}")
+    web.run_app(build_stand(args.days, args.rows, args.latency), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
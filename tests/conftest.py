@@ -1,12 +1,13 @@
 import pytest
 import asyncio
 
-from datetime import datetime
+from datetime import date, datetime
 from unittest.mock import AsyncMock, patch
 from httpx import AsyncClient, ASGITransport
 from pytest_mock import MockerFixture
 from sqlalchemy import text
 
+from app.cache import cache_version, hit_counts, local_cache
 from app.database import engine, MODE, AsyncSessionLocal
 from app.main import app
 from app.models import Base
@@ -31,6 +32,15 @@ async def clean_db(setup_db, session):
     print(f"✅ База данных очищена. Записи после очистки: {records}")
 
 
+@pytest.fixture(autouse=True)
+def clean_local_cache():
+    """ Локальный кэш процесса, известная ему версия данных и счётчики запросов живут между тестами, поэтому сбрасываются """
+
+    local_cache.clear()
+    cache_version.update(version=None, checked_at=0.0)
+    hit_counts.clear()
+
+
 @pytest.fixture(scope="session")
 def event_loop():
     """ Создание глобального event loop для всех async-тестов """
@@ -43,6 +53,7 @@ def event_loop():
 async def populate_db(session):
     """ Фикстура для добавления данных в БД """
     from app.models import SpimexTradingResult
+    from app.repositories import rebuild_trading_dates, refresh_daily_rollups
     from datetime import date, datetime
 
     print("🌱 Заполнение базы данных тестовыми данными")
@@ -95,6 +106,11 @@ async def populate_db(session):
 
     session.add_all(test_data)
     await session.commit()
+
+    # Данные добавлены в обход загрузки, поэтому справочник торговых дней и дневные суммы пересчитываются
+    await rebuild_trading_dates(session)
+    await refresh_daily_rollups(session)
+    await session.commit()
     print("✅ БД заполнена")
 
 
@@ -131,6 +147,7 @@ def mock_spimex_response():
 
     mock_response = AsyncMock()
     mock_response.__aenter__.return_value = mock_response  # Это для асинхронного контекстного менеджера
+    mock_response.headers = {}
 
     async def mock_iter_chunked(size):
         """ Мокает асинхронный итератор для iter_chunked """
@@ -149,6 +166,27 @@ def test_url():
     return f"https://spimex.com/upload/reports/oil_xls/oil_xls_{test_date}162000.xls"
 
 
+@pytest.fixture
+def make_record():
+    """ Фикстура-фабрика строки отчёта в формате пакетной записи """
+
+    def make(exchange_product_id, volume, trade_date=date(2025, 4, 3)):
+        return {
+            "exchange_product_id": exchange_product_id,
+            "exchange_product_name": "Нефть",
+            "oil_id": exchange_product_id[:4],
+            "delivery_basis_id": exchange_product_id[4:7],
+            "delivery_basis_name": "Базис",
+            "delivery_type_id": exchange_product_id[-1],
+            "volume": volume,
+            "total": volume * 100,
+            "count": 1,
+            "date": trade_date,
+        }
+
+    return make
+
+
 @pytest.fixture
 def mock_cache(mocker: MockerFixture):
     """Фикстура для мокирования кэша"""
@@ -156,6 +194,12 @@ def mock_cache(mocker: MockerFixture):
     mock_get = mocker.patch("app.routes.get_cached_data", autospec=True)
     mock_set = mocker.patch("app.routes.set_cached_data", autospec=True)
 
+    # Без объединения промахов: значение считается сразу, без блокировки в Redis
+    async def compute_now(key, compute):
+        return await compute()
+
+    mocker.patch("app.routes.single_flight", side_effect=compute_now)
+
     # Настраиваем поведение
     mock_get.return_value = None
     mock_set.return_value = None
@@ -168,7 +212,10 @@ def mock_spimex_dependencies():
     """Фикстура для мокирования зависимостей в fetch_and_parse_data"""
 
     with patch("app.services.find_latest_spimex_report", new_callable=AsyncMock) as mock_find_reports, \
-            patch("app.services.download_spimex_report", new_callable=AsyncMock) as mock_download, \
-            patch("app.services.parse_spimex_xlsx", new_callable=AsyncMock) as mock_parse:
+            patch("app.services.fetch_spimex_report", new_callable=AsyncMock) as mock_download, \
+            patch("app.services.parse_report", new_callable=AsyncMock) as mock_parse, \
+            patch("app.services.get_report_ledger", new_callable=AsyncMock, return_value={}), \
+            patch("app.services.content_sha256", return_value="0" * 64), \
+            patch("app.services.ingest_report", new_callable=AsyncMock, return_value={}):
         print(f"Mocking dependencies: {mock_find_reports}, {mock_download}, {mock_parse}")
         yield mock_find_reports, mock_download, mock_parse
@@ -0,0 +1,207 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.cache import (
+    CACHE_VERSION_KEY,
+    LocalCache,
+    bump_cache_version,
+    get_cached_data,
+    get_many_cached_data,
+    local_cache,
+    set_cached_data,
+    set_many_cached_data,
+    single_flight,
+)
+
+
+class FakePipeline:
+    """ Конвейер Redis в памяти: команды SET выполняются вместе в execute() """
+
+    def __init__(self, values):
+        self.values = values
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value))
+
+    async def execute(self):
+        self.values.update(self.commands)
+
+
+@pytest.fixture
+def redis(mocker):
+    """ Redis в памяти: get, set, mget, incr и снятие блокировки над словарём """
+
+    values = {}
+    client = AsyncMock()
+    client.get.side_effect = values.get
+
+    def mget(keys, *args):
+        keys = [keys, *args] if isinstance(keys, str) else [*keys, *args]
+        return [values.get(key) for key in keys]
+
+    client.mget.side_effect = mget
+
+    def set_value(key, value, ex=None, px=None, nx=False):
+        if nx and key in values:
+            return None
+        values[key] = value
+        return True
+
+    def release(script, numkeys, key, token):
+        return int(values.get(key) == token and values.pop(key) is not None)
+
+    client.set.side_effect = set_value
+    client.eval.side_effect = release
+    client.pipeline = lambda transaction=True: FakePipeline(values)
+
+    def incr(key):
+        values[key] = int(values.get(key, 0)) + 1
+        return values[key]
+
+    client.incr.side_effect = incr
+    client.values = values
+    mocker.patch("app.cache.get_redis", AsyncMock(return_value=client))
+    return client
+
+
+def test_local_cache_evicts_least_recently_used():
+    """ При переполнении вытесняется давно не использованное значение """
+
+    cache = LocalCache(max_items=2)
+    cache.set("a", b"1", ttl=60)
+    cache.set("b", b"2", ttl=60)
+    cache.get("a")
+    cache.set("c", b"3", ttl=60)
+
+    assert cache.get("a") == b"1"
+    assert cache.get("b") is None
+    assert cache.get("c") == b"3"
+
+
+def test_local_cache_ttl(mocker):
+    """ Значение с истёкшим сроком не отдаётся """
+
+    monotonic = mocker.patch("app.cache.time.monotonic", return_value=100.0)
+    cache = LocalCache(max_items=10)
+    cache.set("a", b"1", ttl=5)
+
+    monotonic.return_value = 104.0
+    assert cache.get("a") == b"1"
+
+    monotonic.return_value = 105.0
+    assert cache.get("a") is None
+    assert "a" not in cache.items
+
+
+async def test_get_cached_data_local_hit_skips_redis(redis):
+    """ Повторное чтение ключа идёт из памяти процесса без обращения к Redis """
+
+    redis.values["v0:key"] = b"[]"
+
+    assert await get_cached_data("key") == b"[]"
+    assert await get_cached_data("key") == b"[]"
+
+    # Версия данных и значение прочитаны из Redis по одному разу
+    assert redis.get.await_count == 2
+
+
+async def test_set_cached_data_fills_local_cache(redis):
+    """ Записанное в Redis значение сразу доступно из памяти процесса """
+
+    await set_cached_data("key", b"[1]")
+
+    assert redis.values["v0:key"] == b"[1]"
+    assert local_cache.get("v0:key") == b"[1]"
+
+
+async def test_bump_cache_version_hides_old_entries(redis):
+    """ После загрузки ответы прежней версии не читаются, новые сохраняются под новой версией """
+
+    await set_cached_data("key", b"old")
+    assert await get_cached_data("key") == b"old"
+
+    await bump_cache_version()
+
+    assert redis.values[CACHE_VERSION_KEY] == 1
+    assert await get_cached_data("key") is None
+    await set_cached_data("key", b"new")
+    assert redis.values["v1:key"] == b"new"
+    assert redis.values["v0:key"] == b"old"
+
+
+async def test_set_cached_data_keeps_miss_version(redis):
+    """ Значение, посчитанное до смены версии, не попадает под новую версию """
+
+    assert await get_cached_data("key") is None
+    await bump_cache_version()
+    await set_cached_data("key", b"stale")
+
+    assert "v1:key" not in redis.values
+    assert redis.values["v0:key"] == b"stale"
+
+
+async def test_single_flight_coalesces_misses(redis):
+    """ Одновременные промахи по ключу считают значение один раз """
+
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        await set_cached_data("key", b"value")
+        return b"value"
+
+    results = await asyncio.gather(*(single_flight("key", compute) for _ in range(10)))
+
+    assert results == [b"value"] * 10
+    assert calls == 1
+    assert redis.values["v0:key"] == b"value"
+    assert "lock:v0:key" not in redis.values
+
+
+async def test_single_flight_waits_for_other_worker(redis):
+    """ Пока значение считает другой воркер (его блокировка в Redis), запрос ждёт это значение """
+
+    redis.values["lock:v0:key"] = "other-worker"
+    compute = AsyncMock(return_value=b"own")
+
+    async def other_worker():
+        await asyncio.sleep(0.1)
+        redis.values["v0:key"] = b"value"
+        del redis.values["lock:v0:key"]
+
+    result, _ = await asyncio.gather(single_flight("key", compute), other_worker())
+
+    assert result == b"value"
+    compute.assert_not_awaited()
+
+
+async def test_get_many_cached_data(redis):
+    """ Ключей нет в памяти процесса — они читаются из Redis одним MGET """
+
+    await set_cached_data("a", b"1")
+    redis.values["v0:b"] = b"2"
+
+    assert await get_many_cached_data(["a", "b", "c"]) == [b"1", b"2", None]
+    redis.mget.assert_awaited_once_with(["v0:b", "v0:c"])
+
+
+async def test_set_many_cached_data(redis):
+    """ Несколько значений сохраняются одним конвейером под текущей версией """
+
+    await set_many_cached_data({"a": b"1", "b": b"2"})
+
+    assert redis.values["v0:a"] == b"1"
+    assert redis.values["v0:b"] == b"2"
+    assert local_cache.get("v0:b") == b"2"
+    redis.set.assert_not_awaited()
@@ -0,0 +1,18 @@
+import pytest
+
+from app.config import conflict_policy
+
+
+@pytest.mark.parametrize("value", ["skip", "update"])
+def test_conflict_policy(value):
+    """ Допустимая политика конфликтов возвращается как есть """
+
+    assert conflict_policy(value) == value
+
+
+@pytest.mark.parametrize("value", ["replace", "Update", ""])
+def test_conflict_policy_unknown(value):
+    """ Неизвестная политика конфликтов отклоняется при загрузке настроек """
+
+    with pytest.raises(ValueError, match="Неизвестная политика конфликтов"):
+        conflict_policy(value)
@@ -0,0 +1,107 @@
+import itertools
+import time
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.util import greenlet_spawn
+
+from app import database
+from app.database import (
+    TimedAsyncAdaptedQueuePool,
+    get_pool_stats,
+    mark_connect_started,
+    mark_connected,
+    mark_primary_write,
+    primary_read_engine,
+    read_engine,
+)
+
+
+@pytest.fixture
+def replicas(mocker):
+    """ Две реплики вместо настроенных и Redis без отметок о записи """
+
+    replica_engines = ["replica-1", "replica-2"]
+    mocker.patch("app.database.replica_engines", replica_engines)
+    mocker.patch("app.database.replica_cycle", itertools.cycle(replica_engines))
+    mocker.patch("app.database.primary_reads", {"until": 0.0, "checked_at": None})
+
+    redis = AsyncMock()
+    redis.get.return_value = None
+    mocker.patch("app.database.get_redis", AsyncMock(return_value=redis))
+    return replica_engines, redis
+
+
+async def test_read_engine_without_replicas():
+    """ Без реплик чтение идёт с основной БД """
+
+    assert not database.replica_engines
+    assert await read_engine() is primary_read_engine
+
+
+async def test_read_engine_round_robin(replicas):
+    """ Чтение распределяется по репликам по кругу """
+
+    assert [await read_engine() for _ in range(3)] == ["replica-1", "replica-2", "replica-1"]
+
+
+async def test_read_engine_primary_after_write(replicas):
+    """ После загрузки чтение идёт с основной БД, пока реплики догоняют её """
+
+    _, redis = replicas
+
+    await mark_primary_write()
+
+    assert await read_engine() is primary_read_engine
+    redis.set.assert_awaited_once()
+
+
+async def test_read_engine_primary_after_write_in_other_worker(replicas):
+    """ Отметка о записи из другого воркера приходит через Redis """
+
+    _, redis = replicas
+    redis.get.return_value = str(time.time() + 5).encode()
+
+    assert await read_engine() is primary_read_engine
+
+
+async def test_read_engine_checks_redis_once_per_refresh(replicas):
+    """ Отметка других воркеров перечитывается из Redis не на каждый запрос """
+
+    _, redis = replicas
+
+    for _ in range(3):
+        await read_engine()
+
+    redis.get.assert_awaited_once()
+
+
+def test_read_engine_is_read_only():
+    """ Сессии для чтения открывают транзакции только на чтение """
+
+    assert primary_read_engine.get_execution_options()["postgresql_readonly"] is True
+
+
+async def test_pool_stats_separate_connect_from_wait():
+    """ Создание нового соединения считается отдельно и не попадает в ожидание свободного соединения """
+
+    def creator(connection_record):
+        mark_connect_started(None, connection_record, (), {})
+        time.sleep(0.05)
+        return Mock()
+
+    pool = TimedAsyncAdaptedQueuePool(creator, pool_size=1, max_overflow=0)
+    event.listen(pool, "connect", mark_connected)
+
+    def checkout_twice():
+        for _ in range(2):
+            pool.connect().close()
+
+    await greenlet_spawn(checkout_twice)
+    stats = get_pool_stats(pool)
+
+    assert stats["checkouts"] == 2
+    assert stats["connects"] == 1
+    assert stats["avg_connect_ms"] >= 50
+    assert stats["max_wait_ms"] < 50
@@ -0,0 +1,115 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from app.database import engine
+from app.migrations import MIGRATIONS, apply_migrations
+
+# spimex_trading_results до миграций: обычная таблица с id SERIAL и индексом по первичному ключу
+BASELINE_SQL = [
+    "DROP TABLE spimex_trading_results CASCADE",
+    """
+    CREATE TABLE spimex_trading_results (
+        id SERIAL PRIMARY KEY,
+        exchange_product_id VARCHAR NOT NULL,
+        exchange_product_name VARCHAR NOT NULL,
+        oil_id VARCHAR NOT NULL,
+        delivery_basis_id VARCHAR NOT NULL,
+        delivery_basis_name VARCHAR NOT NULL,
+        delivery_type_id VARCHAR NOT NULL,
+        volume FLOAT,
+        total FLOAT,
+        count INTEGER,
+        date DATE NOT NULL,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX ix_spimex_trading_results_id ON spimex_trading_results (id)",
+]
+
+INSERT_SQL = text("""
+    INSERT INTO spimex_trading_results (
+        id, exchange_product_id, exchange_product_name, oil_id, delivery_basis_id, delivery_basis_name,
+        delivery_type_id, volume, total, count, date, created_at, updated_at
+    )
+    VALUES (:id, :product, 'Нефть', 'A592', 'UFM', 'Уфа', 'F', 10, 1000, 1, :date, now(), now())
+""")
+
+
+@pytest.fixture
+async def baseline_db():
+    """ Схема до миграций с дублями (date, exchange_product_id); таблица версий миграций удаляется до и после теста """
+
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS schema_migrations"))
+        for sql in BASELINE_SQL:
+            await conn.execute(text(sql))
+        for row_id, product, day in (
+            (10, "A592UFM060F", date(2025, 3, 31)),
+            (11, "A592UFM060F", date(2025, 3, 31)),  # дубль строки 10
+            (12, "A100NVY060J", date(2025, 4, 3)),
+            (40, "A592UFM060F", date(2025, 4, 3)),
+        ):
+            await conn.execute(INSERT_SQL, {"id": row_id, "product": product, "date": day})
+
+    yield
+
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP TABLE IF EXISTS schema_migrations"))
+
+
+async def scalars(conn, sql):
+    return (await conn.execute(text(sql))).scalars().all()
+
+
+async def test_apply_migrations_on_baseline(baseline_db):
+    """ Миграции переводят таблицу до миграций в секционированную: без дублей, с индексами и продолжением id """
+
+    async with engine.begin() as conn:
+        await conn.run_sync(apply_migrations)
+
+    async with engine.begin() as conn:
+        assert await scalars(conn, "SELECT version FROM schema_migrations ORDER BY version") == [
+            version for version, _, _ in MIGRATIONS
+        ]
+        assert await scalars(
+            conn, "SELECT relkind FROM pg_class WHERE oid = CAST('spimex_trading_results' AS regclass)"
+        ) == ["p"]
+
+        # Дубль удалён, строки разложены по партициям месяцев
+        assert await scalars(conn, "SELECT id FROM spimex_trading_results_y2025m03") == [10]
+        assert sorted(await scalars(conn, "SELECT id FROM spimex_trading_results_y2025m04")) == [12, 40]
+        assert await scalars(conn, "SELECT count(*) FROM spimex_trading_results_default") == [0]
+
+        constraints = await scalars(
+            conn, "SELECT conname FROM pg_constraint WHERE conrelid = CAST('spimex_trading_results' AS regclass)"
+        )
+        assert "uq_spimex_trading_results_date_product" in constraints
+        indexes = await scalars(
+            conn, "SELECT indexname FROM pg_indexes WHERE tablename = 'spimex_trading_results'"
+        )
+        assert {
+            "ix_spimex_trading_results_date_id",
+            "ix_spimex_trading_results_oil_date_id",
+            "ix_spimex_trading_results_basis_date_id",
+            "ix_spimex_trading_results_oil_basis_type_date_id",
+        } <= set(indexes)
+        assert "ix_spimex_trading_results_id" not in indexes
+        assert await scalars(conn, "SELECT to_regclass('spimex_trading_results_legacy')") == [None]
+
+        # Счётчик id продолжается после максимального перенесённого
+        new_id = await conn.execute(text("""
+            INSERT INTO spimex_trading_results (
+                exchange_product_id, exchange_product_name, oil_id, delivery_basis_id, delivery_basis_name,
+                delivery_type_id, date
+            )
+            VALUES ('A100NVY060J', 'Нефть', 'A100', 'NVY', 'Новороссийск', 'J', '2025-04-04')
+            RETURNING id
+        """))
+        assert new_id.scalar() > 40
+
+        # Повторный запуск ничего не меняет
+        await conn.run_sync(apply_migrations)
+        assert await scalars(conn, "SELECT count(*) FROM spimex_trading_results") == [4]
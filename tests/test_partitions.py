@@ -0,0 +1,62 @@
+from datetime import date
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import select, text
+
+from app.models import SpimexTradingDate
+from app.partitions import drop_partitions_before, ensure_partitions, known_partitions
+from app.repositories import add_trading_dates, upsert_trading_results
+
+
+@pytest.fixture(autouse=True)
+def reset_known_partitions():
+    """ Таблицы пересоздаются перед каждым тестом, поэтому запомненные партиции сбрасываются """
+
+    known_partitions.clear()
+    yield
+    known_partitions.clear()
+
+
+async def count_rows(session, table):
+    result = await session.execute(text(f"SELECT COUNT(*) FROM {table}"))
+    return result.scalar()
+
+
+async def test_ensure_partitions_moves_default_rows(session, make_record):
+    """ Строки месяца из партиции по умолчанию переносятся в созданную партицию месяца """
+
+    await upsert_trading_results(session, [make_record("A592UFM060F", 10.0), make_record("A100NVY060J", 20.0)])
+    await session.commit()
+    assert await count_rows(session, "spimex_trading_results_default") == 2
+
+    created = await ensure_partitions(session, [date(2025, 4, 3), date(2025, 4, 30)])
+
+    assert created == ["spimex_trading_results_y2025m04"]
+    assert await count_rows(session, "spimex_trading_results_default") == 0
+    assert await count_rows(session, "spimex_trading_results_y2025m04") == 2
+    assert await count_rows(session, "spimex_trading_results") == 2
+
+    # Повторный вызов ничего не создаёт
+    assert await ensure_partitions(session, [date(2025, 4, 10)]) == []
+
+
+async def test_drop_partitions_before(session, mocker, make_record):
+    """ Удаляются партиции месяцев раньше заданного вместе с их торговыми днями, версия кэша меняется """
+
+    mock_bump = mocker.patch("app.partitions.bump_cache_version", AsyncMock())
+    march, april = date(2025, 3, 31), date(2025, 4, 3)
+    await ensure_partitions(session, [march, april])
+    await upsert_trading_results(
+        session, [make_record("A592UFM060F", 10.0, march), make_record("A592UFM060F", 10.0, april)]
+    )
+    await add_trading_dates(session, [march, april])
+    await session.commit()
+
+    dropped = await drop_partitions_before(session, date(2025, 4, 15))
+
+    assert dropped == ["spimex_trading_results_y2025m03"]
+    assert await count_rows(session, "spimex_trading_results") == 1
+    result = await session.execute(select(SpimexTradingDate.date))
+    assert result.scalars().all() == [april]
+    mock_bump.assert_awaited_once()
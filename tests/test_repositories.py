@@ -0,0 +1,103 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from app.models import SpimexDailyRollup, SpimexTradingResult
+from app.repositories import (
+    add_trading_dates,
+    encode_cursor,
+    get_trading_dates_query,
+    paginate,
+    refresh_daily_rollups,
+    upsert_trading_results,
+)
+
+
+async def test_upsert_trading_results_inserts_report(session, make_record):
+    """ Новый отчёт целиком вставляется одним запросом """
+
+    records = [make_record("A592UFM060F", 10.0), make_record("A100NVY060J", 20.0)]
+
+    counts = await upsert_trading_results(session, records)
+    await session.commit()
+
+    assert counts == {"inserted": 2, "updated": 0, "skipped": 0}
+    result = await session.execute(select(SpimexTradingResult))
+    assert len(result.scalars().all()) == 2
+
+
+@pytest.mark.parametrize(
+    "on_conflict, expected_counts, expected_volume",
+    [
+        # Существующая строка пропускается, новая вставляется
+        ("skip", {"inserted": 1, "updated": 0, "skipped": 2}, 10.0),
+
+        # Изменившаяся строка обновляется, неизменившаяся пропускается
+        ("update", {"inserted": 1, "updated": 1, "skipped": 1}, 15.0),
+    ]
+)
+async def test_upsert_trading_results_conflict_policy(session, make_record, on_conflict, expected_counts, expected_volume):
+    """ Повторная загрузка отчёта с политиками skip и update """
+
+    await upsert_trading_results(session, [make_record("A592UFM060F", 10.0), make_record("A100NVY060J", 20.0)])
+    await session.commit()
+
+    records = [
+        make_record("A592UFM060F", 15.0),
+        make_record("A100NVY060J", 20.0),
+        make_record("DT5RKRS060F", 30.0),
+    ]
+    counts = await upsert_trading_results(session, records, on_conflict=on_conflict)
+    await session.commit()
+
+    assert counts == expected_counts
+    result = await session.execute(
+        select(SpimexTradingResult.volume).where(SpimexTradingResult.exchange_product_id == "A592UFM060F")
+    )
+    assert result.scalar_one() == expected_volume
+
+
+async def test_upsert_trading_results_unknown_policy(session, make_record):
+    """ Неизвестная политика конфликтов """
+
+    with pytest.raises(ValueError):
+        await upsert_trading_results(session, [make_record("A592UFM060F", 10.0)], on_conflict="replace")
+
+
+async def test_add_trading_dates(session):
+    """ В справочник попадают только новые дни, список отдаётся от новых к старым """
+
+    assert await add_trading_dates(session, [date(2025, 4, 2), date(2025, 4, 2)]) == 1
+    assert await add_trading_dates(session, [date(2025, 4, 2), date(2025, 4, 3)]) == 1
+    await session.commit()
+
+    assert await get_trading_dates_query(session) == [date(2025, 4, 3), date(2025, 4, 2)]
+
+
+async def test_refresh_daily_rollups(session, make_record):
+    """ Пересчёт дня заменяет его суммы, а не добавляет к ним """
+
+    await upsert_trading_results(session, [make_record("A592UFM060F", 10.0), make_record("A592NVY060F", 20.0)])
+    await refresh_daily_rollups(session, [date(2025, 4, 3)])
+
+    await upsert_trading_results(session, [make_record("A592UFM060F", 15.0)], on_conflict="update")
+    await refresh_daily_rollups(session, [date(2025, 4, 3)])
+    await session.commit()
+
+    result = await session.execute(
+        select(SpimexDailyRollup.volume, SpimexDailyRollup.count)
+        .where(SpimexDailyRollup.dimension == "oil_id", SpimexDailyRollup.value == "A592")
+    )
+    assert result.all() == [(35.0, 2)]
+
+
+def test_paginate_cursor_bounds_date():
+    """ Страница по курсору ограничена датой отдельным условием, чтобы отсекались партиции более новых месяцев """
+
+    query = paginate(select(SpimexTradingResult.id), 10, 0, encode_cursor(date(2025, 4, 3), 40))
+    compiled = query.compile(dialect=postgresql.dialect())
+
+    assert "spimex_trading_results.date <= %(date_1)s" in str(compiled)
+    assert compiled.params["date_1"] == date(2025, 4, 3)
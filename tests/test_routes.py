@@ -1,9 +1,12 @@
+import io
+
 import pytest
 
 from pytest_mock import MockFixture
 from sqlalchemy import text
 
 from app.cache import clear_cache
+from app.repositories import rebuild_trading_dates
 
 
 @pytest.mark.parametrize(
@@ -33,6 +36,30 @@ async def test_fetch_data(client, mocker: MockFixture, params, expected_status_c
         assert response.json() == expected_json
 
 
+@pytest.mark.parametrize(
+    "params, expected_status_code, expected_json",
+    [
+        # Тест на успешный запуск
+        ({"start_date": "01-01-2023", "end_date": "31-12-2023", "workers": 4}, 200,
+         {"message": "Загрузка истории за 2023-01-01 — 2023-12-31 запущена на фоне"}),
+
+        # Тест на перепутанные даты
+        ({"start_date": "31-12-2023", "end_date": "01-01-2023"}, 400, None),
+    ]
+)
+async def test_backfill_data(client, mocker: MockFixture, params, expected_status_code, expected_json):
+    """ Параметризованный тест для эндпоинта backfill """
+
+    mock_backfill = mocker.patch("app.routes.backfill")
+
+    response = await client.post("/backfill/", params=params)
+
+    assert response.status_code == expected_status_code
+    if expected_json:
+        assert response.json() == expected_json
+        mock_backfill.assert_called_once()
+
+
 @pytest.mark.parametrize(
     "params, expected_status_code, expected_json",
     [
@@ -40,6 +67,7 @@ async def test_fetch_data(client, mocker: MockFixture, params, expected_status_c
         ({"count": 5}, 200, ["2025-04-03", "2025-04-02"]),  # Данные в БД
         ({"count": 5}, 200, ["2025-04-03", "2025-04-02"]),  # Кэширование данных
         ({"count": 1000}, 200, ["2025-04-03", "2025-04-02"]),  # Большое значение count
+        ({"count": 1}, 200, ["2025-04-03"]),  # Начало списка дней
     ]
 )
 async def test_test_get_last_trading_dates(
@@ -53,6 +81,7 @@ async def test_test_get_last_trading_dates(
 
     if expected_json == [] and count > 0:  # Если в БД есть данные, очищаем
         await session.execute(text("DELETE FROM spimex_trading_results"))
+        await rebuild_trading_dates(session)
         await session.commit()
         print("🔥 База данных очищена")
 
@@ -142,3 +171,142 @@ async def test_get_trading_results(
             assert response.json()[0]["delivery_basis_id"] == expected_delivery_basis_id
 
     mock_set.assert_called_once()
+
+
+@pytest.mark.parametrize("url, params", [
+    ("/get_trading_results/", {"oil_id": "OIL1"}),
+    ("/get_dynamics/", {"start_date": "01-01-2025", "end_date": "31-12-2025"}),
+])
+async def test_cursor_pagination(client, populate_db, mock_cache, url, params):
+    """ Страницы по курсору идут в том же порядке, что и по offset, без повторов и пропусков """
+
+    by_offset = await client.get(url, params={**params, "limit": 100})
+    expected_ids = [item["id"] for item in by_offset.json()]
+
+    ids = []
+    cursor = None
+    while True:
+        response = await client.get(url, params={**params, "limit": 1, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        ids.extend(item["id"] for item in response.json())
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert ids == expected_ids
+
+
+async def test_invalid_cursor(client, mock_cache):
+    """ Неверный курсор — ошибка 400 """
+
+    response = await client.get("/get_trading_results/", params={"cursor": "не-курсор"})
+
+    assert response.status_code == 400
+
+
+async def test_cache_hit_returns_cached_body(client, mock_cache):
+    """ При попадании в кэш тело и курсор отдаются как сохранены, без обращения к БД """
+
+    mock_get, mock_set = mock_cache
+    body = b'[{"exchange_product_id":"1","oil_id":"OIL1","id":1}]'
+    mock_get.return_value = b"Y3Vyc29y\n" + body
+
+    response = await client.get("/get_trading_results/", params={"limit": 1})
+
+    assert response.status_code == 200
+    assert response.content == body
+    assert response.headers["X-Next-Cursor"] == "Y3Vyc29y"
+    mock_set.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "params, expected_status_code, expected_json",
+    [
+        # Суммы по дням
+        ({"start_date": "01-01-2025", "end_date": "31-12-2025", "group_by": "oil_id", "bucket": "day"}, 200, [
+            {"date": "2025-04-02", "value": "OIL1", "volume": 800.0, "total": 400000.0, "count": 8, "vwap": 500.0},
+            {"date": "2025-04-03", "value": "OIL1", "volume": 1000.0, "total": 500000.0, "count": 10, "vwap": 500.0},
+            {"date": "2025-04-03", "value": "OIL2", "volume": 900.0, "total": 450000.0, "count": 9, "vwap": 500.0},
+        ]),
+
+        # Суммы по месяцам для одного значения
+        ({"start_date": "01-01-2025", "end_date": "31-12-2025", "bucket": "month", "value": "OIL1"}, 200, [
+            {"date": "2025-04-01", "value": "OIL1", "volume": 1800.0, "total": 900000.0, "count": 18, "vwap": 500.0},
+        ]),
+
+        # Группировка по базису поставки и период без торгов
+        ({"start_date": "03-04-2025", "end_date": "03-04-2025", "group_by": "delivery_basis_id", "bucket": "week"},
+         200, [
+            {"date": "2025-03-31", "value": "DB1", "volume": 1000.0, "total": 500000.0, "count": 10, "vwap": 500.0},
+            {"date": "2025-03-31", "value": "DB3", "volume": 900.0, "total": 450000.0, "count": 9, "vwap": 500.0},
+        ]),
+        ({"start_date": "01-01-2024", "end_date": "31-12-2024"}, 200, []),
+
+        # Неверный шаг и перепутанные даты
+        ({"start_date": "01-01-2025", "end_date": "31-12-2025", "bucket": "year"}, 422, None),
+        ({"start_date": "31-12-2025", "end_date": "01-01-2025"}, 400, None),
+    ]
+)
+async def test_get_aggregates(client, populate_db, mock_cache, params, expected_status_code, expected_json):
+    """ Параметризованный тест для эндпоинта get_aggregates """
+
+    response = await client.get("/get_aggregates/", params=params)
+
+    assert response.status_code == expected_status_code
+    if expected_json is not None:
+        assert response.json() == expected_json
+
+
+@pytest.mark.parametrize(
+    "params, expected_status_code, expected_lines",
+    [
+        # CSV: заголовок и строки в хронологическом порядке
+        ({"start_date": "01-01-2025", "end_date": "31-12-2025", "oil_id": "OIL1", "format": "csv"}, 200, 3),
+
+        # NDJSON: одна строка на запись
+        ({"start_date": "01-01-2025", "end_date": "31-12-2025", "format": "ndjson"}, 200, 3),
+
+        # Пустой период и перепутанные даты
+        ({"start_date": "01-01-2024", "end_date": "31-12-2024", "format": "csv"}, 200, 1),
+        ({"start_date": "31-12-2025", "end_date": "01-01-2025"}, 400, None),
+    ]
+)
+async def test_export_trading_results(client, populate_db, params, expected_status_code, expected_lines):
+    """ Параметризованный тест для эндпоинта export """
+
+    response = await client.get("/export/", params=params)
+
+    assert response.status_code == expected_status_code
+    if expected_lines is not None:
+        lines = response.text.splitlines()
+        assert len(lines) == expected_lines
+        if params["format"] == "csv" and expected_lines > 1:
+            assert lines[0].startswith("id,exchange_product_id")
+            assert "2025-04-02" in lines[1] and "2025-04-03" in lines[2]
+
+
+async def test_export_trading_results_parquet(client, populate_db):
+    """ Выгрузка в Parquet читается обратно целиком """
+
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    response = await client.get(
+        "/export/", params={"start_date": "01-01-2025", "end_date": "31-12-2025", "format": "parquet"}
+    )
+
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == 3
+    assert sorted(table.column("oil_id").to_pylist()) == ["OIL1", "OIL1", "OIL2"]
+
+
+async def test_db_pool_stats(client):
+    """ Метрики пула соединений: размер, занятые соединения и время ожидания """
+
+    response = await client.get("/db_pool_stats/")
+
+    assert response.status_code == 200
+    stats = response.json()
+    assert {"size", "checked_out", "checkouts", "avg_wait_ms", "max_wait_ms", "timeouts", "connects", "avg_connect_ms"} <= stats.keys()
+    assert stats["timeouts"] >= 0
@@ -1,19 +1,31 @@
 import os
 import pytest
 
-from unittest.mock import patch
-from app.saver import find_latest_spimex_report, download_spimex_report
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+from app.models import SpimexReportLedger
+from app.saver import find_latest_spimex_report, download_spimex_report, spimex_report_url
 
 TEST_SAVE_DIR = "test_spimex_reports"
 os.makedirs(TEST_SAVE_DIR, exist_ok=True)
 
 
+def make_response(status):
+    """ Мок-ответ с заданным статусом """
+
+    response = AsyncMock()
+    response.__aenter__.return_value = response
+    response.status = status
+    response.headers = {}
+    return response
+
+
 class TestFindLatestSpimexReport:
     async def test_find_latest_spimex_report_200(self, test_url, mock_spimex_response):
         """ Тест успешного поиска доступных файлов """
         mock_spimex_response.status = 200
 
-        with patch("aiohttp.ClientSession.get", return_value=mock_spimex_response):
+        with patch("aiohttp.ClientSession.head", return_value=mock_spimex_response):
             result = await find_latest_spimex_report(1)
 
         assert result is not None
@@ -24,11 +36,48 @@ class TestFindLatestSpimexReport:
         """ Тест случая, когда файлы не найдены """
         mock_spimex_response.status = 404
 
-        with patch("aiohttp.ClientSession.get", return_value=mock_spimex_response):
+        with patch("aiohttp.ClientSession.head", return_value=mock_spimex_response):
             result = await find_latest_spimex_report(5)
 
         assert result is None
 
+    async def test_find_latest_spimex_report_order(self):
+        """ Параллельная проверка возвращает n самых новых файлов по порядку """
+        today = datetime.today()
+        missing_url = spimex_report_url(today)
+
+        def head(url, **kwargs):
+            return make_response(404 if url == missing_url else 200)
+
+        with patch("aiohttp.ClientSession.head", side_effect=head):
+            result = await find_latest_spimex_report(2)
+
+        assert result == [spimex_report_url(today - timedelta(days=1)), spimex_report_url(today - timedelta(days=2))]
+
+    async def test_find_latest_spimex_report_head_not_allowed(self, test_url, mock_spimex_response):
+        """ Если HEAD не поддерживается, проверка идёт GET-запросом первого байта """
+        mock_spimex_response.status = 206
+
+        with patch("aiohttp.ClientSession.head", return_value=make_response(405)), \
+                patch("aiohttp.ClientSession.get", return_value=mock_spimex_response) as mock_get:
+            result = await find_latest_spimex_report(1)
+
+        assert result == [test_url]
+        assert mock_get.call_args.kwargs["headers"] == {"Range": "bytes=0-0"}
+
+    async def test_find_latest_spimex_report_skips_unchanged(self, test_url, mock_spimex_response):
+        """ Отчёт из журнала с тем же ETag не возвращается, но учитывается в n """
+        mock_spimex_response.status = 200
+        mock_spimex_response.headers = {"ETag": '"v1"'}
+        ledger = {test_url: SpimexReportLedger(url=test_url, etag='"v1"')}
+
+        validators = {}
+        with patch("aiohttp.ClientSession.head", return_value=mock_spimex_response):
+            result = await find_latest_spimex_report(1, ledger=ledger, validators=validators)
+
+        assert result is None
+        assert validators[test_url] == {"etag": '"v1"', "last_modified": None}
+
 
 class TestDownloadSpimexReport:
 
@@ -47,10 +96,12 @@ class TestDownloadSpimexReport:
     async def test_test_download_spimex_report_404(self, test_url, mock_spimex_response):
         """ Тест скачивания файла, когда сервер возвращает 404 """
         mock_spimex_response.status = 404
+        missing = set()
         with patch("aiohttp.ClientSession.get", return_value=mock_spimex_response):
-            result = await download_spimex_report(test_url)
+            result = await download_spimex_report(test_url, missing=missing)
 
         assert result is None
+        assert missing == {test_url}
 
     async def test_test_download_spimex_report_500(self, test_url, mock_spimex_response):
         """ Тест на обработку исключений при скачивании """
@@ -59,3 +110,29 @@ class TestDownloadSpimexReport:
             result = await download_spimex_report(test_url)
 
         assert result is None
+
+    async def test_download_spimex_report_retry(self, test_url, mock_spimex_response):
+        """ Временная недоступность сервера: запрос повторяется """
+        mock_spimex_response.status = 200
+
+        with patch("app.saver.HTTP_RETRY_BACKOFF", 0), \
+                patch("aiohttp.ClientSession.get", side_effect=[make_response(503), mock_spimex_response]) as mock_get:
+            result = await download_spimex_report(test_url)
+
+        assert result is not None
+        assert mock_get.call_count == 2
+
+        os.remove(result)
+
+    async def test_download_spimex_report_not_modified(self, test_url):
+        """ Условный запрос по журналу: сервер ответил 304, файл не скачивается """
+        ledger_entry = SpimexReportLedger(url=test_url, etag='"v1"', last_modified="Thu, 03 Apr 2025 16:20:00 GMT")
+
+        with patch("aiohttp.ClientSession.get", return_value=make_response(304)) as mock_get:
+            result = await download_spimex_report(test_url, ledger_entry)
+
+        assert result is None
+        assert mock_get.call_args.kwargs["headers"] == {
+            "If-None-Match": '"v1"',
+            "If-Modified-Since": "Thu, 03 Apr 2025 16:20:00 GMT",
+        }
@@ -1,8 +1,15 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
 from unittest import mock
 
 import pytest
 
-from app.services import fetch_and_parse_data
+from app.backfill import backfill_urls, record_missing_reports
+from app.repositories import get_report_ledger
+from app.saver import spimex_report_url
+from app import services
+from app.services import fetch_and_parse_data, parse_report, run_ingest_pipeline
 
 
 @pytest.mark.parametrize(
@@ -43,11 +50,11 @@ async def test_fetch_and_parse_data(
 
     await fetch_and_parse_data(2)
 
-    mock_find_reports.assert_awaited_once_with(n=2)
+    mock_find_reports.assert_awaited_once_with(n=2, ledger={}, validators={})
     assert mock_download.await_count == expected_download_calls
 
     for url in mock_find_reports_return:
-        mock_download.assert_any_await(url)
+        mock_download.assert_any_await(url, None, {}, set())
 
     if expected_parse_calls:
         for file in expected_parse_calls:
@@ -57,3 +64,63 @@ async def test_fetch_and_parse_data(
         mock_parse.assert_not_awaited()
     print(f"Mock parse calls: {mock_parse.mock_calls}")
 
+
+
+@pytest.mark.parametrize("interval, expected_publishes", [(0, 3), (3600, 2)])
+async def test_run_ingest_pipeline_publishes_during_run(interval, expected_publishes):
+    """ Изменения публикуются по ходу загрузки: сразу после первого отчёта, затем не чаще интервала и в конце """
+
+    counts = {"inserted": 1, "updated": 0, "skipped": 0, "new_dates": 1}
+    with mock.patch("app.services.fetch_spimex_report", new_callable=mock.AsyncMock, return_value=b"xls"), \
+            mock.patch("app.services.parse_report", new_callable=mock.AsyncMock, return_value=[{}]), \
+            mock.patch("app.services.ingest_report", new_callable=mock.AsyncMock, side_effect=lambda *args: dict(counts)), \
+            mock.patch("app.services.INGEST_PUBLISH_INTERVAL", interval), \
+            mock.patch("app.services.publish_ingest", new_callable=mock.AsyncMock) as mock_publish:
+        stats = await run_ingest_pipeline(None, ["url1", "url2", "url3"], {})
+
+    assert stats["files"] == 3
+    assert mock_publish.await_count == expected_publishes
+
+
+def test_backfill_urls_skips_ledger():
+    """ Загрузка истории продолжается с дней, которых нет в журнале """
+
+    ledger = {spimex_report_url(date(2025, 4, 2)): mock.Mock()}
+
+    urls = backfill_urls(date(2025, 4, 1), date(2025, 4, 3), ledger)
+
+    assert urls == [spimex_report_url(date(2025, 4, 3)), spimex_report_url(date(2025, 4, 1))]
+
+
+async def test_record_missing_reports(session):
+    """ Прошедшие дни без отчёта записываются в журнал и больше не запрашиваются, сегодняшний — нет """
+
+    today = date.today()
+    past_url, today_url = spimex_report_url(today - timedelta(days=1)), spimex_report_url(today)
+
+    assert await record_missing_reports(session, {past_url, today_url}) == 1
+
+    ledger = await get_report_ledger(session)
+    assert ledger[past_url].row_count == 0
+    assert today_url not in ledger
+    assert backfill_urls(today - timedelta(days=1), today, ledger) == [today_url]
+
+
+async def test_parse_report_stops_only_broken_pool(mocker):
+    """ Сломанный пул останавливается без ожидания, а созданный после него другой задачей — нет """
+
+    broken, replacement = mock.Mock(), mock.Mock()
+    future = Future()
+    future.set_exception(BrokenProcessPool("процесс упал"))
+    broken.submit.return_value = future
+    mocker.patch("app.services.get_parse_pool", return_value=broken)
+
+    mocker.patch("app.services.parse_pool", replacement)
+    assert await parse_report(b"", "url") is None
+    replacement.shutdown.assert_not_called()
+    assert services.parse_pool is replacement
+
+    mocker.patch("app.services.parse_pool", broken)
+    assert await parse_report(b"", "url") is None
+    broken.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+    assert services.parse_pool is None
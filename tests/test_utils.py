@@ -0,0 +1,99 @@
+import io
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from app.utils import REPORT_TABLE_MARKER, parse_report_records, table_columns
+from benchmarks.sample_reports import HEADER, build_report_rows
+
+RECORD_COLUMNS = [
+    "exchange_product_id", "exchange_product_name", "oil_id", "delivery_basis_id", "delivery_basis_name",
+    "delivery_type_id", "volume", "total", "count", "date",
+]
+
+
+def sheet_frame(rows):
+    """ Лист отчёта, как его читает pd.read_excel(header=None): пустые ячейки — NaN, строки одной ширины """
+
+    width = max(len(row) for row in rows)
+    return pd.DataFrame([[None if value == "" else value for value in row] + [None] * (width - len(row)) for row in rows])
+
+
+def parse_rows(mocker, rows):
+    """ Разбор отчёта из строк листа без файла Excel """
+
+    mocker.patch("app.utils.read_report_sheet", return_value=sheet_frame(rows))
+    return parse_report_records(b"", "oil_xls_20250403162000.xls")
+
+
+def pandas_columns(header_row):
+    """ Названия столбцов, которые для той же строки заголовков строит сам pandas """
+
+    buffer = io.StringIO()
+    pd.DataFrame([header_row]).to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    return pd.read_csv(buffer, header=0).columns.str.replace("\n", " ").str.strip()
+
+
+def test_parse_report_records(mocker):
+    """ Дата торгов и строки инструментов со сделками; итоговые строки и прочерки отбрасываются """
+
+    rows = build_report_rows(date(2025, 4, 3), 40, seed=1)
+    traded = [row for row in rows[9:] if len(row) > 1 and row[1] != "Итого:" and row[4] != "-"]
+
+    trading_date, records = parse_rows(mocker, rows)
+
+    assert trading_date == datetime(2025, 4, 3)
+    assert 0 < len(records) == len(traded) < 40
+    assert all(list(record) == RECORD_COLUMNS for record in records)
+
+    code, name, basis_name, volume, total = traded[0][1:6]
+    assert records[0] == {
+        "exchange_product_id": code,
+        "exchange_product_name": name,
+        "oil_id": code[:4],
+        "delivery_basis_id": code[4:7],
+        "delivery_basis_name": basis_name,
+        "delivery_type_id": code[-1],
+        "volume": float(volume),
+        "total": float(total),
+        "count": traded[0][12],
+        "date": date(2025, 4, 3),
+    }
+    assert [record["exchange_product_id"] for record in records] == [row[1] for row in traded]
+
+
+def test_table_columns_matches_pandas():
+    """ Пустые и повторяющиеся заголовки называются так же, как в pandas: "Unnamed: N" и суффиксы ".1" """
+
+    header_row = pd.Series([None if value == "" else value for value in HEADER] + ["Базис\nпоставки", None])
+
+    columns = table_columns(header_row)
+
+    assert columns.tolist() == pandas_columns(header_row).tolist()
+    assert columns[0] == "Unnamed: 0"
+    assert columns[8] == "Unnamed: 8"
+    assert columns[3] == "Базис поставки"
+    assert columns[13] == "Базис поставки.1"
+
+
+def test_parse_report_duplicate_header_keeps_first_column(mocker):
+    """ Повторный столбец с тем же названием не подменяет данные первого """
+
+    rows = build_report_rows(date(2025, 4, 3), 5, seed=2)
+    rows = [row + ["Базис\nпоставки"] if row is rows[7] else row for row in rows]
+
+    _, records = parse_rows(mocker, rows)
+
+    assert records
+    assert all(record["delivery_basis_name"].startswith("ст. ") for record in records)
+
+
+def test_parse_report_without_marker(mocker):
+    """ Лист без строки "Единица измерения: Метрическая тонна" не разбирается """
+
+    rows = [row for row in build_report_rows(date(2025, 4, 3), 5) if REPORT_TABLE_MARKER not in row]
+
+    with pytest.raises(ValueError, match="Метрическая тонна"):
+        parse_rows(mocker, rows)
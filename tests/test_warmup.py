@@ -0,0 +1,60 @@
+from datetime import date
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.cache import TRADING_DATES_CACHE_KEY, hit_counts
+from app.warmup import NO_FILTERS, default_specs, warm_cache
+
+
+@pytest.fixture
+def warm_mocks(mocker):
+    """ Кэш для прогрева: все ключи пустые """
+
+    mocker.patch("app.warmup.get_many_cached_data", AsyncMock(side_effect=lambda keys: [None] * len(keys)))
+    mocker.patch("app.warmup.flush_hits", AsyncMock())
+    top_hits = mocker.patch("app.warmup.get_top_hits", AsyncMock(return_value=[]))
+    mock_set = mocker.patch("app.warmup.set_many_cached_data", AsyncMock())
+    return top_hits, mock_set
+
+
+def test_default_specs():
+    """ Заданные ключи: торговые дни, первые страницы последних торгов и окна динамики до сегодня """
+
+    specs = default_specs(date(2025, 4, 10))
+
+    assert ("get_last_trading_dates", {}) in specs
+    assert ("get_trading_results", {"filters": NO_FILTERS, "limit": 10, "offset": 0}) in specs
+    assert ("get_dynamics", {
+        "start_date": "2025-04-03", "end_date": "2025-04-10", "filters": NO_FILTERS, "limit": 10, "offset": 0,
+    }) in specs
+
+
+async def test_warm_cache(populate_db, warm_mocks):
+    """ После загрузки заданные и частые ключи считаются и кэшируются, повторы — один раз """
+
+    top_hits, mock_set = warm_mocks
+    oil_filter = {"oil_id": "OIL1", "delivery_type_id": None, "delivery_basis_id": None}
+    top_hits.return_value = [
+        ("get_trading_results", {"filters": oil_filter, "limit": 10, "offset": 0}),
+        ("get_trading_results", {"filters": NO_FILTERS, "limit": 10, "offset": 0}),
+    ]
+
+    warmed = await warm_cache()
+
+    # Все посчитанные значения сохраняются одним вызовом
+    mock_set.assert_awaited_once()
+    values = mock_set.await_args.args[0]
+    assert warmed == len(values) == len(default_specs(date.today())) + 1
+    assert "get_trading_results:OIL1:None:None:10:0:None" in values
+    assert values[TRADING_DATES_CACHE_KEY] == b'["2025-04-03","2025-04-02"]'
+
+
+async def test_record_hit(client, mock_cache):
+    """ Запросы первых страниц учитываются для прогрева, страницы по курсору — нет """
+
+    await client.get("/get_trading_results/", params={"oil_id": "OIL1"})
+    await client.get("/get_trading_results/", params={"oil_id": "OIL1"})
+    await client.get("/get_trading_results/", params={"cursor": "MjAyNS0wNC0wMzox"})
+
+    assert list(hit_counts.values()) == [2]